@@ -3,57 +3,19 @@ from tkinter import ttk, messagebox
 import random
 import string
 import subprocess
-import re
+import os
+
+from gws_user_creator import GroupIndex, GroupRules, resolution_key, fold_text
 
 # List of departments available in our organization
 DEPARTMENTS = ["Core Business", "Engineering Support", "Finance", "HR", "Legal", "Management", "Marketing", "Operations Domain", "Organizations Super Admins", "Sales"]
 
-# Base groups for all users in a department
-BASE_GROUPS = {
-    "core business": ["account-management@deytech.se", "core-business-analytics@deytech.se", "core-business-operations@deytech.se", "customer-success@deytech.se"],
-    "engineering support": ["engineering-support@deytech.se", "engineering@deytech.se", "devops@deytech.se"],
-    "finance": ["finance-accounting@deytech.se", "finance-compliance@deytech.se", "finance-payroll@deytech.se", "compliance@deytech.se"],
-    "hr": ["hr@deytech.se", "hr-recruitment@deytech.se", "hr-benefits@deytech.se"],
-    "legal": ["legal-compliance@deytech.se", "legal-contracts@deytech.se", "compliance@deytech.se"],
-    "management": ["strategic-management@deytech.se"],
-    "marketing": ["marketing@deytech.se", "digital-marketing@deytech.se", "marketing-analytics@deytech.se"],
-    "operations domain": ["project-management@deytech.se", "operations-it@deytech.se", "operations-supply-chain@deytech.se"],
-    "organizations super admins": ["all-admin@deytech.se", "admin@deytech.se", "super-admins-security@deytech.se"],
-    "sales": ["sales@deytech.se", "all-sales@deytech.se", "sales-operations@deytech.se"]
-}
-
-# Role-specific groups based on job title keywords
-ROLE_GROUPS = {
-    "core business": {"manager": "core-business-managers@deytech.se", "lead": "core-business-leadership@deytech.se", "director": "core-business-directors@deytech.se"},
-    "engineering support": {"manager": "engineering-managers@deytech.se", "lead": "engineering-support-leadership@deytech.se", "director": "engineering-directors@deytech.se"},
-    "finance": {"manager": "finance-managers@deytech.se", "lead": "finance-leadership@deytech.se", "director": "finance-directors@deytech.se"},
-    "hr": {"manager": "hr-managers@deytech.se", "lead": "hr-leadership@deytech.se", "director": "hr-directors@deytech.se"},
-    "legal": {"manager": "legal-managers@deytech.se", "lead": "legal-leadership@deytech.se", "director": "legal-directors@deytech.se"},
-    "management": {"manager": "management-managers@deytech.se", "lead": "management-leads@deytech.se", "director": "management-directors@deytech.se"},
-    "marketing": {"manager": "marketing-managers@deytech.se", "lead": "marketing-leadership@deytech.se", "director": "marketing-directors@deytech.se"},
-    "operations domain": {"manager": "operations-managers@deytech.se", "lead": "operations-leadership@deytech.se", "director": "operations-directors@deytech.se"},
-    "organizations super admins": {"manager": "super-admins-managers@deytech.se", "lead": "super-admins-leadership@deytech.se", "director": "super-admins-directors@deytech.se"},
-    "sales": {"manager": "sales-managers@deytech.se", "lead": "sales-leadership@deytech.se", "director": "sales-directors@deytech.se"}
-}
-
-# Base groups for all users in a location
-BASE_LOCATION_GROUPS = {
-    "stockholm": ["stockholm-office@deytech.se", "stockholm-all@deytech.se", "stockholm-facilities@deytech.se", "stockholm-it@deytech.se", "stockholm-social@deytech.se"],
-    "gothenburg": ["gothenburg-office@deytech.se", "gothenburg-all@deytech.se", "gothenburg-facilities@deytech.se", "gothenburg-itsupport@deytech.se", "gothenburg-social@deytech.se"],
-    "remote": ["remote-team@deytech.se"]
-}
-
-# Role-specific location groups based on job title keywords
-ROLE_LOCATION_GROUPS = {
-    "stockholm": {"manager": "stockholm-management@deytech.se", "lead": "stockholm-management@deytech.se", "director": "stockholm-management@deytech.se"},
-    "gothenburg": {"manager": "gothenburg-management@deytech.se", "lead": "gothenburg-management@deytech.se", "director": "gothenburg-management@deytech.se"}
-}
-
-# Groups that everyone should be added to regardless of department/location
-DEFAULT_GROUPS = ["all-company@deytech.se", "announcements@deytech.se"]
+# The fixed group lists (department, role, location and company-wide groups) are rules in
+# group_rules_hardcoded.json, in the same format the dynamic version reads from group_rules.json
+GROUP_RULES = GroupRules.load(os.path.join(os.path.dirname(os.path.abspath(__file__)), "group_rules_hardcoded.json"))
 
-def normalize_text(text):
-    return text.lower().strip()
+# There is no group directory to look groups up in, so every group the rules name counts as existing
+ALL_GROUPS = GroupIndex(group for rule in GROUP_RULES.rules for group in rule.groups)
 
 def generate_random_password(length=None):
     if length is None:
@@ -61,39 +23,14 @@ def generate_random_password(length=None):
     characters = string.ascii_letters + string.digits
     return ''.join(random.choice(characters) for _ in range(length))
 
-# Determines which groups a user should be added to based on department, location, and job title
+# Determines which groups a user should be added to based on department, location, and job title.
+# Every location named in the Location field counts, so "Stockholm/Gothenburg" gets both offices' groups.
 def determine_groups_to_add(department, location, job_title):
+    dept_key, location_key, roles = resolution_key(department or "", location or "", job_title or "", GROUP_RULES, ALL_GROUPS)
+    locations = {GROUP_RULES.location_name(word, ALL_GROUPS) for word in fold_text(location or "").split()} - {""}
     groups = set()
-    dept_clean = normalize_text(department or "")
-    location_clean = normalize_text(location or "")
-    job_title_clean = normalize_text(job_title or "")
-    
-    # Add base department groups
-    if dept_clean in BASE_GROUPS:
-        groups.update(BASE_GROUPS[dept_clean])
-    
-    # Add role-specific department groups based on exact keyword match
-    if dept_clean in ROLE_GROUPS:
-        role_groups = ROLE_GROUPS[dept_clean]
-        for keyword, group in role_groups.items():
-            if re.search(r'\b' + re.escape(keyword) + r'\b', job_title_clean):
-                groups.add(group)
-    
-    # Add base location groups
-    for loc_key, loc_groups in BASE_LOCATION_GROUPS.items():
-        if loc_key in location_clean:
-            groups.update(loc_groups)
-    
-    # Add role-specific location groups based on exact keyword match
-    for loc_key, role_groups in ROLE_LOCATION_GROUPS.items():
-        if loc_key in location_clean:
-            for keyword, group in role_groups.items():
-                if re.search(r'\b' + re.escape(keyword) + r'\b', job_title_clean):
-                    groups.add(group)
-    
-    # Add default groups that everyone gets
-    groups.update(DEFAULT_GROUPS)
-    
+    for name in locations or [location_key]:
+        groups.update(GROUP_RULES.resolve((dept_key, name, roles), ALL_GROUPS))
     return sorted(groups)
 
 # Executes Google Admin SDK commands through GAM - our interface to Google Workspace
@@ -0,0 +1,210 @@
+"""Benchmarks for group resolution and provisioning throughput.
+
+Group resolution is timed against synthetic group directories in the deytech.se naming scheme.
+Provisioning is timed end to end against fake_gam.py, with a configurable GAM startup time and API
+latency: through `gam batch`, with one process per command, and on the GAM worker pool. Each run starts from an
+empty fake tenant, optionally with injected errors or an API quota to load-test the retries. Results
+are written as JSON so runs from different versions can be compared:
+
+    python benchmark_gws.py --sizes 100 1000 10000 100000 --output bench_results.json
+    python benchmark_gws.py --skip-provisioning
+    python benchmark_gws.py --sizes 100 --users 100 --quota 20 --error-rate 0.01
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import gws_user_creator as gws
+
+LOCATIONS = ["stockholm", "gothenburg", "malmo", "uppsala", "remote"]
+DEPARTMENT_SUFFIXES = ["", "-operations", "-analytics", "-compliance", "-projects", "-social"]
+LOCATION_SUFFIXES = ["-office", "-all", "-facilities", "-it", "-social", "-management"]
+ROLE_SUFFIXES = ["-managers", "-leadership", "-directors", "-leads"]
+JOB_TITLES = ["", "Engineer", "Team Lead", "Manager", "Director of Sales", "Accountant", "Senior Recruiter"]
+
+# Builds a group directory of `size` emails that looks like a real deytech.se tenant: department,
+# location and role groups first, padded with project and team groups
+def generate_groups(size, seed=0):
+    rng = random.Random(seed)
+    groups = ["all-company@deytech.se", "announcements@deytech.se"]
+    for dept_key in gws.DEPARTMENT_KEYS.values():
+        groups += [f"{dept_key}{suffix}@deytech.se" for suffix in DEPARTMENT_SUFFIXES + ROLE_SUFFIXES]
+    for location in LOCATIONS:
+        groups += [f"{location}{suffix}@deytech.se" for suffix in LOCATION_SUFFIXES]
+
+    names = set(groups)
+    while len(names) < size:
+        kind = rng.choice(["project", "team", "dl", "ext"])
+        owner = rng.choice(list(gws.DEPARTMENT_KEYS.values()) + LOCATIONS + ["misc", "partner", "vendor"])
+        names.add(f"{kind}-{owner}-{rng.randrange(10 ** 6):06d}@deytech.se")
+    return sorted(names)[:size]
+
+def generate_queries(count, seed=0):
+    rng = random.Random(seed)
+    return [(rng.choice(gws.DEPARTMENTS), rng.choice(LOCATIONS + [""]).title(), rng.choice(JOB_TITLES)) for _ in range(count)]
+
+def bench_resolution(size, queries):
+    groups = generate_groups(size)
+
+    # Memory is measured on a separate build that is thrown away, so tracing does not slow down the timed one
+    tracemalloc.start()
+    traced_index = gws.GroupIndex(groups)
+    index_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del traced_index
+
+    start = time.perf_counter()
+    group_index = gws.GroupIndex(groups)
+    build_seconds = time.perf_counter() - start
+
+    timings = []
+    for department, location, job_title in queries:
+        start = time.perf_counter()
+        gws.determine_groups_to_add(department, location, job_title, group_index)
+        timings.append(time.perf_counter() - start)
+
+    samples = groups[::max(1, size // 1000)]
+    start = time.perf_counter()
+    for group in samples:
+        assert group in group_index
+    membership_seconds = (time.perf_counter() - start) / len(samples)
+    start = time.perf_counter()
+    for group in samples:
+        group_index.groups_with_prefix(group.partition("-")[0], limit=10)
+    prefix_seconds = (time.perf_counter() - start) / len(samples)
+
+    return {
+        "benchmark": "group_resolution",
+        "groups": size,
+        "queries": len(queries),
+        "index_build_seconds": build_seconds,
+        "first_query_seconds": timings[0],
+        "mean_query_seconds": statistics.mean(timings),
+        "median_query_seconds": statistics.median(timings),
+        "max_query_seconds": max(timings),
+        "membership_seconds": membership_seconds,
+        "prefix_lookup_seconds": prefix_seconds,
+        "group_list_bytes": sys.getsizeof(groups) + sum(sys.getsizeof(group) for group in groups),
+        "index_bytes": index_bytes,
+    }
+
+def generate_users(count, seed=0):
+    rng = random.Random(seed)
+    users = []
+    for n in range(count):
+        department = rng.choice(gws.DEPARTMENTS)
+        users.append({
+            "given_name": "Bench", "family_name": f"User{n}", "email": f"bench.user{n}@deytech.se",
+            "job_title": rng.choice(JOB_TITLES), "department": department, "manager_email": "",
+            "location": rng.choice(LOCATIONS).title(), "phone": "", "password": "Bench12345", "change_password": "off",
+        })
+    return users
+
+MODES = {"batch": "gam batch", "commands": "process per command", "pool": "worker pool"}
+
+def bench_provisioning(users, group_index, mode, startup, latency, state_file):
+    gws.GAM_BATCH_ENABLED = mode == "batch"
+    gws.GAM_LIBRARY = "fake_gam" if mode == "pool" else ""
+    os.environ["FAKE_GAM_STARTUP"] = str(startup)
+    os.environ["FAKE_GAM_LATENCY"] = str(latency)
+    os.environ["FAKE_GAM_STATE"] = state_file
+
+    start = time.perf_counter()
+    results = gws.provision_users(users, group_index)
+    seconds = time.perf_counter() - start
+    # The next mode starts from a fresh tenant, so the workers holding this one are stopped
+    gws.close_gam_worker_pool()
+
+    commands = sum(len(gws.build_user_batch(data, result["groups"])) for data, result in zip(users, results))
+    return {
+        "benchmark": "provisioning",
+        "mode": MODES[mode],
+        "users": len(users),
+        "commands": commands,
+        "fake_gam_startup_seconds": startup,
+        "fake_gam_latency_seconds": latency,
+        "fake_gam_quota": float(os.environ.get("FAKE_GAM_QUOTA", 0)),
+        "fake_gam_error_rate": float(os.environ.get("FAKE_GAM_ERROR_RATE", 0)),
+        "seconds": seconds,
+        "seconds_per_user": seconds / len(users),
+        "commands_per_second": commands / seconds,
+        "failed_users": sum(1 for result in results if result["status"] != "created"),
+    }
+
+# Time to start the stand-in process and exit, which every per-command GAM call pays on top of the API
+def bench_spawn(runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(gws.GAM_COMMAND + ["print", "groups", "email"], capture_output=True,
+                       env=dict(os.environ, FAKE_GAM_STARTUP="0", FAKE_GAM_LATENCY="0", FAKE_GAM_QUOTA="0", FAKE_GAM_ERROR_RATE="0"))
+        timings.append(time.perf_counter() - start)
+    return {"benchmark": "process_spawn", "runs": runs, "median_seconds": statistics.median(timings)}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000], help="group directory sizes to resolve against")
+    parser.add_argument("--queries", type=int, default=200, help="group resolutions per directory size")
+    parser.add_argument("--users", type=int, default=20, help="users provisioned per provisioning run")
+    parser.add_argument("--startup", type=float, default=0.5, help="fake GAM startup seconds per process")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake GAM API latency seconds per command")
+    parser.add_argument("--quota", type=float, default=0, help="fake GAM API calls per second before quota errors (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of fake GAM API calls that fail")
+    parser.add_argument("--skip-provisioning", action="store_true")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args(argv)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": [],
+    }
+
+    queries = generate_queries(args.queries)
+    for size in args.sizes:
+        result = bench_resolution(size, queries)
+        print(f"resolution  {size:>7} groups: index {result['index_build_seconds'] * 1000:.1f} ms, "
+              f"median query {result['median_query_seconds'] * 1e6:.0f} us, "
+              f"{result['index_bytes'] / 2 ** 20:.1f} MB for a {result['group_list_bytes'] / 2 ** 20:.1f} MB list")
+        report["results"].append(result)
+
+    if not args.skip_provisioning:
+        gws.GAM_COMMAND = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_gam.py")]
+        gws.GAM_RATE_LIMITER = gws.TokenBucket(0)
+        users = generate_users(args.users)
+        with tempfile.TemporaryDirectory() as work_dir:
+            groups = generate_groups(200)
+            groups_file = os.path.join(work_dir, "groups.txt")
+            with open(groups_file, "w", encoding="utf-8") as f:
+                f.write("\n".join(groups))
+            os.environ["FAKE_GAM_GROUPS_FILE"] = groups_file
+            os.environ["FAKE_GAM_QUOTA"] = str(args.quota)
+            os.environ["FAKE_GAM_ERROR_RATE"] = str(args.error_rate)
+            group_index = gws.GroupIndex(groups)
+
+            result = bench_spawn(5)
+            print(f"spawn       median {result['median_seconds'] * 1000:.0f} ms per process")
+            report["results"].append(result)
+            for mode in MODES:
+                state_file = os.path.join(work_dir, f"tenant-{mode}.sqlite3")
+                result = bench_provisioning(users, group_index, mode, args.startup, args.latency, state_file)
+                print(f"provisioning ({result['mode']}): {result['users']} users, {result['commands']} commands in "
+                      f"{result['seconds']:.1f} s ({result['seconds_per_user']:.2f} s per user)")
+                report["results"].append(result)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
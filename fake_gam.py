@@ -0,0 +1,313 @@
+"""Stand-in for the `gam` executable, for benchmarks, offline end-to-end runs and load tests without a
+Google Workspace tenant.
+
+Use it by pointing the user creator at it:
+
+    GWS_GAM_COMMAND="python fake_gam.py" FAKE_GAM_STATE=/tmp/tenant.sqlite3 python Create_User_GWS-Dynamic.py
+
+Users, groups and memberships are kept in a SQLite file when FAKE_GAM_STATE is set, shared by every
+fake GAM process that points at it. Without it the state is in memory and only lasts for one
+invocation, which is enough for `gam batch` files and read-only commands. Supported commands are the
+ones the user creator sends:
+
+    print groups email
+    print groups member <email>
+    print users [query email:<email>] [fields ...]
+    create user <email> firstname <name> lastname <name> password <pw> changepassword <bool> org <path>
+    update user <email> organization [title <t>] [department <d>] [location <l>] | phones type work value <n> | manager <email> | org <path>
+    update group <group> add|delete member <email>
+    create group <group> | delete group <group>
+    report admin start <time> event CREATE_GROUP,DELETE_GROUP
+    batch <file>              (with `commit-batch` lines and `redirect stdout|stderr <file>` prefixes)
+
+It can also be loaded once by gam_worker.py (`GWS_GAM_LIBRARY=fake_gam`), which calls
+`CallGAMCommand` for each command like it does with the real GAM package.
+
+Errors look like GAM's: `ERROR: ...` on stderr and a non-zero exit code. Creating a user who exists,
+adding a member twice or updating someone unknown fail the way the real API does. Behaviour is
+configured through environment variables:
+
+    FAKE_GAM_STATE         SQLite file holding the tenant; in memory when unset
+    FAKE_GAM_GROUPS_FILE   file with one group email per line, loaded when the tenant has no groups yet
+    FAKE_GAM_STARTUP       seconds spent starting up, like GAM loading its config and OAuth token
+    FAKE_GAM_LATENCY       seconds each API call takes
+    FAKE_GAM_ERROR_RATE    fraction of API calls (0 to 1) that fail with a backend error
+    FAKE_GAM_FAIL_PATTERN  regular expression; API calls whose command line matches it always fail
+    FAKE_GAM_QUOTA         API calls per second allowed across all processes sharing the state, beyond
+                           which calls fail with a 429 quota error; 0 means unlimited
+    FAKE_GAM_SEED          seed for the error injection, for reproducible runs
+"""
+import csv
+import datetime
+import os
+import random
+import re
+import shlex
+import sqlite3
+import sys
+import time
+
+STARTUP_DELAY = float(os.environ.get("FAKE_GAM_STARTUP", 0))
+API_LATENCY = float(os.environ.get("FAKE_GAM_LATENCY", 0))
+GROUPS_FILE = os.environ.get("FAKE_GAM_GROUPS_FILE", "")
+STATE_FILE = os.environ.get("FAKE_GAM_STATE", "")
+ERROR_RATE = float(os.environ.get("FAKE_GAM_ERROR_RATE", 0))
+FAIL_PATTERN = re.compile(os.environ["FAKE_GAM_FAIL_PATTERN"]) if os.environ.get("FAKE_GAM_FAIL_PATTERN") else None
+QUOTA = float(os.environ.get("FAKE_GAM_QUOTA", 0))
+RANDOM = random.Random(os.environ.get("FAKE_GAM_SEED"))
+
+# Columns of `print users`, in the order GAM prints them
+USER_COLUMNS = ["primaryEmail", "name.givenName", "name.familyName", "orgUnitPath", "organizations.0.title",
+                "organizations.0.department", "organizations.0.location", "phones.0.value", "relations.0.value"]
+# Option words of `update user` and `create user` mapped to their column in the users table
+USER_OPTIONS = {"firstname": "given_name", "lastname": "family_name", "org": "org_unit", "ou": "org_unit", "manager": "manager"}
+ORGANIZATION_OPTIONS = {"title": "title", "department": "department", "location": "location"}
+
+class GamError(Exception):
+    """A failed API call; the message is printed after `ERROR: ` and the command exits with 1."""
+
+class Tenant:
+    """Users, groups and memberships of the fake Google Workspace tenant."""
+
+    def __init__(self, path=""):
+        # Several fake GAM processes run at once during parallel provisioning, so writers wait for each other
+        self.db = sqlite3.connect(path or ":memory:", timeout=30, isolation_level=None)
+        if path:
+            self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                email TEXT PRIMARY KEY COLLATE NOCASE, given_name TEXT, family_name TEXT, org_unit TEXT,
+                title TEXT, department TEXT, location TEXT, phone TEXT, manager TEXT);
+            CREATE TABLE IF NOT EXISTS groups (email TEXT PRIMARY KEY COLLATE NOCASE);
+            CREATE TABLE IF NOT EXISTS members (
+                group_email TEXT COLLATE NOCASE, member TEXT COLLATE NOCASE, PRIMARY KEY (group_email, member));
+            CREATE INDEX IF NOT EXISTS members_by_member ON members (member);
+            CREATE TABLE IF NOT EXISTS api_calls (at REAL);
+            CREATE TABLE IF NOT EXISTS admin_events (at REAL, name TEXT, group_email TEXT);
+        """)
+        if GROUPS_FILE and not self.db.execute("SELECT 1 FROM groups LIMIT 1").fetchone():
+            with open(GROUPS_FILE, encoding="utf-8") as f:
+                self.db.executemany("INSERT OR IGNORE INTO groups VALUES (?)", ((line.strip(),) for line in f if line.strip()))
+
+    # Every API call goes through here: latency first, then the quota and the injected errors
+    def api_call(self, args):
+        time.sleep(API_LATENCY)
+        if QUOTA:
+            now = time.time()
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self.db.execute("DELETE FROM api_calls WHERE at < ?", (now - 1,))
+                calls = self.db.execute("SELECT COUNT(*) FROM api_calls").fetchone()[0]
+                if calls < QUOTA:
+                    self.db.execute("INSERT INTO api_calls VALUES (?)", (now,))
+            finally:
+                self.db.execute("COMMIT")
+            if calls >= QUOTA:
+                raise GamError("429: Quota exceeded for quota metric 'Queries' - rateLimitExceeded")
+        if FAIL_PATTERN and FAIL_PATTERN.search(" ".join(args)):
+            raise GamError(f"400: Invalid Input: injected failure for {' '.join(args[:3])}")
+        if ERROR_RATE and RANDOM.random() < ERROR_RATE:
+            raise GamError("503: Backend Error - backendError")
+
+    def require_user(self, email):
+        if not self.db.execute("SELECT 1 FROM users WHERE email = ?", (email,)).fetchone():
+            raise GamError(f"User: {email}, Does not exist")
+
+    def require_group(self, group):
+        if not self.db.execute("SELECT 1 FROM groups WHERE email = ?", (group,)).fetchone():
+            raise GamError(f"Group: {group}, Does not exist")
+
+    def print_groups(self, stdout):
+        print("email", file=stdout)
+        for (email,) in self.db.execute("SELECT email FROM groups ORDER BY email"):
+            print(email, file=stdout)
+
+    def print_member_groups(self, member, stdout):
+        print("email", file=stdout)
+        for (email,) in self.db.execute("SELECT group_email FROM members WHERE member = ? ORDER BY group_email", (member,)):
+            print(email, file=stdout)
+
+    def print_users(self, email, stdout):
+        query = "SELECT email, given_name, family_name, org_unit, title, department, location, phone, manager FROM users"
+        rows = self.db.execute(query + " WHERE email = ?", (email,)) if email else self.db.execute(query + " ORDER BY email")
+        writer = csv.writer(stdout, lineterminator="\n")
+        writer.writerow(USER_COLUMNS)
+        writer.writerows([value or "" for value in row] for row in rows)
+
+    def create_user(self, email, options):
+        fields = parse_user_options(options)
+        try:
+            self.db.execute("INSERT INTO users (email, given_name, family_name, org_unit) VALUES (?, ?, ?, ?)",
+                            (email, fields.get("given_name", ""), fields.get("family_name", ""), fields.get("org_unit", "/")))
+        except sqlite3.IntegrityError:
+            raise GamError(f"User: {email}, Create Failed: Duplicate, Entity already exists.") from None
+        self.update_user(email, options)
+
+    def update_user(self, email, options):
+        self.require_user(email)
+        fields = parse_user_options(options)
+        if fields:
+            assignments = ", ".join(f"{column} = ?" for column in fields)
+            self.db.execute(f"UPDATE users SET {assignments} WHERE email = ?", (*fields.values(), email))
+
+    def create_group(self, group):
+        try:
+            self.db.execute("INSERT INTO groups VALUES (?)", (group,))
+        except sqlite3.IntegrityError:
+            raise GamError(f"Group: {group}, Create Failed: Duplicate, Entity already exists.") from None
+        self.db.execute("INSERT INTO admin_events VALUES (?, 'CREATE_GROUP', ?)", (time.time(), group))
+
+    def delete_group(self, group):
+        self.require_group(group)
+        self.db.execute("DELETE FROM groups WHERE email = ?", (group,))
+        self.db.execute("DELETE FROM members WHERE group_email = ?", (group,))
+        self.db.execute("INSERT INTO admin_events VALUES (?, 'DELETE_GROUP', ?)", (time.time(), group))
+
+    # Admin audit log entries for group changes, in the columns `gam report admin` prints
+    def print_admin_events(self, start, events, stdout):
+        since = datetime.datetime.fromisoformat(start.replace("Z", "+00:00")).timestamp() if start else 0
+        names = events or ["CREATE_GROUP", "DELETE_GROUP"]
+        rows = self.db.execute(f"SELECT at, name, group_email FROM admin_events WHERE at >= ? AND name IN ({', '.join('?' * len(names))}) ORDER BY at DESC",
+                               (since, *names))
+        writer = csv.writer(stdout, lineterminator="\n")
+        writer.writerow(["actor.email", "id.time", "name", "GROUP_EMAIL"])
+        for at, name, group in rows:
+            writer.writerow(["admin@fake", datetime.datetime.fromtimestamp(at, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ"), name, group])
+
+    def add_member(self, group, member):
+        self.require_group(group)
+        try:
+            self.db.execute("INSERT INTO members VALUES (?, ?)", (group, member))
+        except sqlite3.IntegrityError:
+            raise GamError(f"Group: {group}, Member: {member}, Add Failed: Duplicate, Member already exists.") from None
+
+    def delete_member(self, group, member):
+        self.require_group(group)
+        if not self.db.execute("DELETE FROM members WHERE group_email = ? AND member = ?", (group, member)).rowcount:
+            raise GamError(f"Group: {group}, Member: {member}, Remove Failed: Not a member")
+
+# Reads the option words of `create user` / `update user` into users table columns; the password and
+# anything else the table does not keep is skipped
+def parse_user_options(options):
+    fields = {}
+    i = 0
+    while i < len(options):
+        word = options[i].lower()
+        if word == "organization":
+            i += 1
+            while i + 1 < len(options) and options[i].lower() in ORGANIZATION_OPTIONS:
+                fields[ORGANIZATION_OPTIONS[options[i].lower()]] = options[i + 1]
+                i += 2
+            continue
+        if word == "phones" and "value" in options[i:]:
+            value_at = options.index("value", i)
+            fields["phone"] = options[value_at + 1] if value_at + 1 < len(options) else ""
+            i = value_at + 2
+            continue
+        if word in USER_OPTIONS and i + 1 < len(options):
+            fields[USER_OPTIONS[word]] = options[i + 1]
+        i += 2
+    return fields
+
+# Strips leading `redirect stdout|stderr <file>` options, returning (args, stdout, stderr)
+def apply_redirects(args, stdout, stderr):
+    while len(args) >= 3 and args[0] == "redirect":
+        target = open(args[2], "w", encoding="utf-8")
+        if args[1] == "stdout":
+            stdout = target
+        else:
+            stderr = target
+        args = args[3:]
+    return args, stdout, stderr
+
+def run_batch(tenant, path):
+    returncode = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            parts = shlex.split(line)
+            if not parts or parts[0] == "commit-batch":
+                continue
+            if parts[0] == "gam":
+                parts = parts[1:]
+            returncode = max(returncode, run_command(tenant, parts))
+    return returncode
+
+# Runs one API command against the tenant, raising GamError when it fails
+def dispatch(tenant, args, stdout):
+    if args[:3] == ["print", "groups", "email"]:
+        tenant.api_call(args)
+        tenant.print_groups(stdout)
+    elif args[:3] == ["print", "groups", "member"] and len(args) >= 4:
+        tenant.api_call(args)
+        tenant.print_member_groups(args[3], stdout)
+    elif args[:2] == ["print", "users"]:
+        tenant.api_call(args)
+        query = args[args.index("query") + 1] if "query" in args[:-1] else ""
+        tenant.print_users(query[len("email:"):] if query.startswith("email:") else "", stdout)
+    elif args[:2] == ["create", "user"] and len(args) >= 3:
+        tenant.api_call(args)
+        tenant.create_user(args[2], args[3:])
+        print(f"User: {args[2]}, Created", file=stdout)
+    elif args[:2] == ["update", "user"] and len(args) >= 3:
+        tenant.api_call(args)
+        tenant.update_user(args[2], args[3:])
+        print(f"User: {args[2]}, Updated", file=stdout)
+    elif args[:2] == ["update", "group"] and args[3:5] in (["add", "member"], ["delete", "member"]) and len(args) >= 6:
+        tenant.api_call(args)
+        if args[3] == "add":
+            tenant.add_member(args[2], args[5])
+        else:
+            tenant.delete_member(args[2], args[5])
+        print(f"Group: {args[2]}, Member: {args[5]}, {'Added' if args[3] == 'add' else 'Removed'}", file=stdout)
+    elif args[:2] in (["create", "group"], ["delete", "group"]) and len(args) >= 3:
+        tenant.api_call(args)
+        if args[0] == "create":
+            tenant.create_group(args[2])
+        else:
+            tenant.delete_group(args[2])
+        print(f"Group: {args[2]}, {'Created' if args[0] == 'create' else 'Deleted'}", file=stdout)
+    elif args[:2] == ["report", "admin"]:
+        tenant.api_call(args)
+        start = args[args.index("start") + 1] if "start" in args[:-1] else ""
+        events = args[args.index("event") + 1].split(",") if "event" in args[:-1] else []
+        tenant.print_admin_events(start, events, stdout)
+    else:
+        return False
+    return True
+
+# Runs one GAM command line and returns its exit code
+def run_command(tenant, args):
+    args, stdout, stderr = apply_redirects(args, sys.stdout, sys.stderr)
+    try:
+        if args[:1] == ["batch"] and len(args) == 2:
+            return run_batch(tenant, args[1])
+        if dispatch(tenant, args, stdout):
+            return 0
+        print(f"ERROR: fake_gam does not support: {' '.join(args)}", file=stderr)
+        return 2
+    except GamError as e:
+        print(f"ERROR: {e}", file=stderr)
+        return 1
+    finally:
+        for stream in (stdout, stderr):
+            if stream not in (sys.stdout, sys.stderr):
+                stream.close()
+
+tenant = None
+
+# Library entry point shaped like GAM's own gam.CallGAMCommand, so gam_worker.py can run many
+# commands in one process; the startup delay is only paid on the first call
+def CallGAMCommand(args):
+    global tenant
+    if tenant is None:
+        time.sleep(STARTUP_DELAY)
+        tenant = Tenant(STATE_FILE)
+    args = list(args)
+    return run_command(tenant, args[1:] if args[:1] == ["gam"] else args)
+
+def main(argv=None):
+    time.sleep(STARTUP_DELAY)
+    return run_command(Tenant(STATE_FILE), list(sys.argv[1:] if argv is None else argv))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""Long-lived GAM worker, started by the GAM worker pool in gws_user_creator.py.
+
+GAM itself is a Python program that can be used as a library (`gam.CallGAMCommand`), so a
+worker loads it once, with its config and OAuth token, and then runs every command it is
+sent in the same process instead of paying GAM's startup for each one:
+
+    python gam_worker.py gam          # the installed GAM package
+    python gam_worker.py fake_gam     # the offline stand-in
+
+Requests are read from stdin and results written to stdout, one JSON object per line:
+
+    {"args": ["update", "group", "hr@deytech.se", "add", "member", "anna.berg@deytech.se"]}
+    {"returncode": 0, "stdout": "...", "stderr": "..."}
+
+The first line written is {"ready": true}, or {"error": "..."} if the module cannot be loaded.
+"""
+import contextlib
+import importlib
+import io
+import json
+import os
+import sys
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    module_name = argv[0] if argv else "gam"
+
+    # Results go out on a private copy of stdout; anything GAM writes straight to file descriptor 1
+    # ends up on stderr instead of corrupting the protocol
+    protocol = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    def send(message):
+        protocol.write(json.dumps(message) + "\n")
+        protocol.flush()
+
+    try:
+        module = importlib.import_module(module_name)
+        if hasattr(module, "initializeLogging"):
+            module.initializeLogging()
+    except Exception as e:
+        send({"error": f"could not load {module_name}: {e}"})
+        return 1
+    send({"ready": True})
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        args = json.loads(line)["args"]
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                returncode = module.CallGAMCommand(["gam"] + args)
+            except SystemExit as e:
+                returncode = e.code if isinstance(e.code, int) else 1
+            except Exception as e:
+                print(f"ERROR: {e}", file=sys.stderr)
+                returncode = 1
+        send({"returncode": returncode or 0, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()})
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
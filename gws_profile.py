@@ -0,0 +1,203 @@
+"""Profiling for --profile: where the time and memory go between launching the tool and using it.
+
+While profiling is on, the main thread runs under cProfile, allocations are traced with
+tracemalloc, every thread's stack is sampled for a flame graph, and named phases (startup,
+loading groups, previews, user creation) are timed. When the run ends everything is written
+to a new directory under GWS_PROFILE_DIR:
+
+    report.txt        phase timings, memory, the top allocation sites and the cProfile summary
+    phases.json       every phase as it happened, for comparing runs before and after a change
+    profile.pstats    the cProfile data, for pstats, snakeviz and similar viewers
+    stacks.collapsed  sampled stacks in the collapsed format read by flamegraph.pl and speedscope
+
+Code marks phases with profile_phase(), or begin_phase() and end_phase() when a phase starts and
+ends in different callbacks. Those do nothing unless start_profiling() was called.
+"""
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# How often every thread's stack is sampled for stacks.collapsed, in seconds
+SAMPLE_INTERVAL = 0.005
+
+# Allocation sites and functions listed in report.txt
+REPORT_TOP = 25
+
+active_profiler = None
+
+# Seconds since the operating system started this process, which covers the interpreter and the
+# imports that ran before profiling could start. Only known on Linux.
+def seconds_since_process_start():
+    try:
+        with open("/proc/self/stat", encoding="ascii") as f:
+            start_ticks = int(f.read().rpartition(")")[2].split()[19])
+        with open("/proc/uptime", encoding="ascii") as f:
+            uptime = float(f.read().split()[0])
+        return max(uptime - start_ticks / os.sysconf("SC_CLK_TCK"), 0.0)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+class StackSampler(threading.Thread):
+    """Counts the stacks of every other thread, SAMPLE_INTERVAL apart, as collapsed stack lines:
+    the thread name and each function from the outermost in, separated by ';'."""
+
+    def __init__(self):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == self.ident:
+                    continue
+                functions = []
+                while frame is not None:
+                    module = frame.f_globals.get("__name__", "?")
+                    functions.append(f"{module}.{frame.f_code.co_qualname}".replace(";", ":"))
+                    frame = frame.f_back
+                functions.append(thread_names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(functions))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+class Profiler:
+    """One profiled run. Phase times are seconds since start(); memory is what tracemalloc has
+    seen allocated since then and not yet freed."""
+
+    def __init__(self, directory, label):
+        self.directory = directory
+        self.label = label
+        self.profile = cProfile.Profile()
+        self.sampler = StackSampler()
+        self.lock = threading.Lock()
+        self.open_phases = {}
+        self.phases = []
+        self.started = None
+        self.before_start = None
+
+    def start(self):
+        self.before_start = seconds_since_process_start()
+        self.started = time.perf_counter()
+        tracemalloc.start()
+        self.sampler.start()
+        self.profile.enable()
+
+    def begin(self, name):
+        with self.lock:
+            self.open_phases[name] = (time.perf_counter(), tracemalloc.get_traced_memory()[0])
+
+    def end(self, name):
+        now = time.perf_counter()
+        memory = tracemalloc.get_traced_memory()[0]
+        with self.lock:
+            if name not in self.open_phases:
+                return
+            started, memory_before = self.open_phases.pop(name)
+            self.phases.append({
+                "phase": name,
+                "start": round(started - self.started, 6),
+                "seconds": round(now - started, 6),
+                "memory_bytes": memory,
+                "memory_change_bytes": memory - memory_before,
+            })
+
+    # Stops profiling and writes the files; returns the directory they were written to
+    def stop(self):
+        self.profile.disable()
+        self.sampler.stop()
+        self.phases.sort(key=lambda phase: phase["start"])
+        snapshot = tracemalloc.take_snapshot()
+        memory, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        seconds = time.perf_counter() - self.started
+
+        run_dir = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+        os.makedirs(run_dir, exist_ok=True)
+        self.profile.dump_stats(os.path.join(run_dir, "profile.pstats"))
+        with open(os.path.join(run_dir, "stacks.collapsed"), "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.sampler.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(run_dir, "phases.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "run": self.label,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "seconds_before_profiling": self.before_start,
+                "seconds": round(seconds, 6),
+                "memory_bytes": memory,
+                "peak_memory_bytes": peak,
+                "phases": self.phases,
+            }, f, indent=2)
+        with open(os.path.join(run_dir, "report.txt"), "w", encoding="utf-8") as f:
+            f.write(self.report(snapshot, seconds, memory, peak))
+        return run_dir
+
+    def report(self, snapshot, seconds, memory, peak):
+        lines = [f"Profile of {self.label}, {time.strftime('%Y-%m-%d %H:%M:%S')}", ""]
+        if self.before_start is not None:
+            lines.append(f"Process start to profiling start (interpreter and imports): {self.before_start:.3f} s")
+        lines += [
+            f"Profiled for {seconds:.3f} s; traced memory {memory / 2 ** 20:.1f} MB at the end, {peak / 2 ** 20:.1f} MB at the peak",
+            "Times include the overhead of cProfile and tracemalloc, so compare them with other profiled runs.",
+            "",
+            "Phases (first start in seconds after profiling started):",
+            f"  {'phase':<24} {'count':>5} {'first start':>11} {'total s':>9} {'mean s':>9} {'max s':>9} {'memory MB':>10}",
+        ]
+        by_name = {}
+        for phase in self.phases:
+            by_name.setdefault(phase["phase"], []).append(phase)
+        for name, phases in by_name.items():
+            durations = [phase["seconds"] for phase in phases]
+            lines.append(f"  {name:<24} {len(phases):>5} {phases[0]['start']:>11.3f} {sum(durations):>9.3f} "
+                         f"{sum(durations) / len(durations):>9.4f} {max(durations):>9.4f} {phases[-1]['memory_bytes'] / 2 ** 20:>10.1f}")
+
+        if self.open_phases:
+            lines.append(f"  Not finished when profiling stopped: {', '.join(self.open_phases)}")
+
+        lines += ["", "Largest allocation sites still held at the end:"]
+        for stat in snapshot.statistics("lineno")[:REPORT_TOP]:
+            frame = stat.traceback[0]
+            lines.append(f"  {stat.size / 1024:>10.1f} KB {stat.count:>8} blocks  {frame.filename}:{frame.lineno}")
+
+        stats_text = io.StringIO()
+        pstats.Stats(self.profile, stream=stats_text).sort_stats("cumulative").print_stats(REPORT_TOP)
+        lines += ["", "Main thread by cumulative time (cProfile):", stats_text.getvalue()]
+        return "\n".join(lines)
+
+def start_profiling(directory, label):
+    global active_profiler
+    active_profiler = Profiler(directory, label)
+    active_profiler.start()
+    return active_profiler
+
+def stop_profiling():
+    global active_profiler
+    profiler, active_profiler = active_profiler, None
+    return profiler.stop() if profiler is not None else None
+
+def begin_phase(name):
+    if active_profiler is not None:
+        active_profiler.begin(name)
+
+def end_phase(name):
+    if active_profiler is not None:
+        active_profiler.end(name)
+
+@contextlib.contextmanager
+def profile_phase(name):
+    begin_phase(name)
+    try:
+        yield
+    finally:
+        end_phase(name)
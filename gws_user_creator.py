@@ -0,0 +1,2102 @@
+"""Group resolution and GAM provisioning for the Google Workspace user creator.
+
+This module has no GUI dependencies, so it can be imported by scripts and workers that
+never open a window. Run it directly (or Create_User_GWS-Dynamic.py) for the command line:
+
+    python gws_user_creator.py preview --department HR --location Stockholm --job-title "HR Manager"
+    python gws_user_creator.py create --given-name Anna --family-name Berg --email anna.berg@deytech.se --department HR
+    python gws_user_creator.py bulk new_hires.csv
+    python gws_user_creator.py refresh-groups
+
+Without a subcommand the GUI is started.
+"""
+import random
+import string
+import subprocess
+import re
+import os
+import json
+import time
+import threading
+import shlex
+import csv
+import io
+import logging
+import argparse
+import sys
+import tempfile
+import sqlite3
+import queue
+import atexit
+import bisect
+import contextlib
+import heapq
+import itertools
+import unicodedata
+from array import array
+from collections import namedtuple, Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# List of departments available in our organization
+DEPARTMENTS = ["Core Business", "Engineering Support", "Finance", "HR", "Legal", "Management", "Marketing", "Operations Domain", "Organizations Super Admins", "Sales"]
+
+# Mapping of full department names to simplified keys used in group names
+DEPARTMENT_KEYS = {
+    "core business": "core-business",
+    "engineering support": "engineering",
+    "finance": "finance",
+    "hr": "hr",
+    "legal": "legal",
+    "management": "management",
+    "marketing": "marketing",
+    "operations domain": "operations",
+    "organizations super admins": "super-admins",
+    "sales": "sales"
+}
+
+# Progress of every GAM call is reported through this logger: the console when run from the
+# command line, plus the log pane while the window is open
+log = logging.getLogger("gws_user_creator")
+
+# Fields read from each row of a bulk import CSV, the same ones the form collects
+USER_FIELDS = ["given_name", "family_name", "email", "job_title", "department", "manager_email", "location", "phone", "password", "change_password"]
+REQUIRED_FIELDS = ["given_name", "family_name", "email", "department", "password"]
+
+# Number of users provisioned per `gam batch` run during a bulk import
+BULK_CHUNK_SIZE = 25
+
+# How GAM is started; point GWS_GAM_COMMAND at another executable (e.g. "python fake_gam.py") for tests and benchmarks
+GAM_COMMAND = shlex.split(os.environ.get("GWS_GAM_COMMAND", "gam"), posix=os.name != "nt")
+
+# Set GWS_GAM_BATCH=0 to run every GAM command in its own process instead of one `gam batch` run per user
+GAM_BATCH_ENABLED = os.environ.get("GWS_GAM_BATCH", "1") != "0"
+
+# Commands that do not depend on each other run on a pool of this many workers, started at most
+# GAM_RATE_LIMIT times per second (0 disables the limit). Quota errors are retried with exponential backoff.
+GAM_WORKERS = int(os.environ.get("GWS_GAM_WORKERS", 8))
+GAM_RATE_LIMIT = float(os.environ.get("GWS_GAM_RATE_LIMIT", 10))
+GAM_MAX_RETRIES = int(os.environ.get("GWS_GAM_MAX_RETRIES", 5))
+GAM_RETRY_BASE_DELAY = 1.0  # seconds
+GAM_RETRY_MAX_DELAY = 32.0  # seconds
+
+# Set GWS_GAM_LIBRARY to the module GAM can be imported as ("gam" for a pip-installed GAM, "fake_gam" for the
+# stand-in) to run commands on up to GWS_GAM_POOL_SIZE long-lived gam_worker.py processes, which load GAM
+# and its OAuth token once, instead of starting GAM for every command
+GAM_LIBRARY = os.environ.get("GWS_GAM_LIBRARY", "")
+GAM_POOL_SIZE = int(os.environ.get("GWS_GAM_POOL_SIZE", GAM_WORKERS))
+
+# Error output that means the Google API quota was hit and the command can simply be tried again later
+QUOTA_ERROR_PATTERN = re.compile(r"quota|rate ?limit|\b429\b", re.IGNORECASE)
+
+# Every GAM call, group fetch and group resolution is timed; set GWS_METRICS_FILE to also append
+# each measurement to that file as one JSON object per line
+METRICS_FILE = os.environ.get("GWS_METRICS_FILE", "")
+
+# Directory --profile writes each run's report, cProfile data and flame graph stacks to
+PROFILE_DIR = os.environ.get("GWS_PROFILE_DIR", "gws_profile")
+
+# The gws_profile module once --profile has started profiling. It is only imported then, so a
+# normal run does not load cProfile, pstats and tracemalloc; until then the phase markers below
+# do nothing.
+profiler = None
+
+def begin_phase(name):
+    if profiler is not None:
+        profiler.begin_phase(name)
+
+def end_phase(name):
+    if profiler is not None:
+        profiler.end_phase(name)
+
+def profile_phase(name):
+    return contextlib.nullcontext() if profiler is None else profiler.profile_phase(name)
+
+# Write-ahead journal of planned and completed GAM operations per user, so a rerun after a failure
+# only retries what did not finish
+JOURNAL_FILE = os.environ.get("GWS_JOURNAL_FILE", os.path.join(os.path.expanduser("~"), ".gws_user_creator", "journal.sqlite3"))
+
+# Error output of an `add member` for someone who is already in the group, and of a `delete member`
+# for someone who is not in it
+ALREADY_MEMBER_PATTERN = re.compile(r"duplicate|already exists|member already", re.IGNORECASE)
+NOT_MEMBER_PATTERN = re.compile(r"not a member|does not exist|not ?found", re.IGNORECASE)
+# Error output of a `create user` for an account that is already there, which the updates can still go to
+USER_EXISTS_PATTERN = re.compile(r"duplicate|already exists", re.IGNORECASE)
+
+# Local copy of the group directory so startup does not have to wait for GAM.
+# Both values can be overridden through environment variables.
+GROUP_CACHE_FILE = os.environ.get("GWS_GROUP_CACHE_FILE", os.path.join(os.path.expanduser("~"), ".gws_user_creator", "groups_cache.json"))
+GROUP_CACHE_TTL = int(os.environ.get("GWS_GROUP_CACHE_TTL", 6 * 60 * 60))  # seconds
+
+# A refresh normally only reads the groups created or deleted since the previous one from the admin
+# audit log and merges them into the cached list. The whole directory is listed again once the last
+# full listing is older than GROUP_FULL_REFRESH_INTERVAL, to catch what the log does not cover, such as
+# renamed groups. The log can trail behind a little, so the last GROUP_CHANGES_OVERLAP of it is re-read.
+GROUP_FULL_REFRESH_INTERVAL = int(os.environ.get("GWS_GROUP_FULL_REFRESH_INTERVAL", 7 * 24 * 60 * 60))  # seconds
+GROUP_CHANGES_OVERLAP = 60 * 60  # seconds
+GROUP_CHANGE_EVENTS = ["CREATE_GROUP", "DELETE_GROUP"]
+
+# Which groups each user gets is decided by the rules in this JSON file. It is compiled once and
+# reloaded when its modification time changes, checked at most every GROUP_RULES_CHECK_INTERVAL seconds.
+GROUP_RULES_FILE = os.environ.get("GWS_GROUP_RULES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "group_rules.json"))
+GROUP_RULES_CHECK_INTERVAL = 2.0  # seconds
+
+metrics_lock = threading.Lock()
+metrics_listeners = []
+
+# Records one timed phase: appended to METRICS_FILE when set, and passed to any active MetricsCollector
+def record_metric(phase, seconds, **fields):
+    record = {"time": round(time.time(), 3), "phase": phase, "seconds": None if seconds is None else round(seconds, 6)}
+    record.update(fields)
+    with metrics_lock:
+        if METRICS_FILE:
+            try:
+                with open(METRICS_FILE, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+            except OSError as e:
+                log.warning(f"Could not write metrics to {METRICS_FILE}: {e}")
+        for listener in metrics_listeners:
+            listener(record)
+    return record
+
+class MetricsCollector:
+    """Keeps every metric recorded while the `with` block runs, on any thread, for per-user summaries.
+    Records are also indexed by the users they involve as they arrive, so a summary for one user
+    only reads that user's records, however many other users the run has."""
+
+    def __enter__(self):
+        self.records = []
+        self.records_by_user = {}
+        with metrics_lock:
+            metrics_listeners.append(self.add)
+        return self
+
+    def __exit__(self, *exc_info):
+        with metrics_lock:
+            metrics_listeners.remove(self.add)
+
+    def add(self, record):
+        self.records.append(record)
+        for user in {record.get("user"), *record.get("users", ())} - {None}:
+            self.records_by_user.setdefault(user, []).append(record)
+
+    # Seconds and count per phase, limited to the records that involve the given user when one is passed.
+    # A record shared by several users, such as a `gam batch` run, is charged to each of them in equal
+    # shares, so the users' timings add up to the time actually spent. GAM commands are split by
+    # command type, e.g. "gam update group".
+    def summary(self, user=None):
+        phases = {}
+        for record in self.records if user is None else self.records_by_user.get(user, ()):
+            if record["seconds"] is None:
+                continue
+            seconds = record["seconds"]
+            if user is not None and len(record.get("users", ())) > 1:
+                seconds /= len(record["users"])
+            phase = f"gam {record['command_type']}" if record["phase"] == "gam_command" else record["phase"]
+            totals = phases.setdefault(phase, {"count": 0, "seconds": 0.0})
+            totals["count"] += 1
+            totals["seconds"] = round(totals["seconds"] + seconds, 6)
+        return phases
+
+def format_seconds(seconds):
+    return f"{seconds:.2f}s" if seconds >= 1 else f"{seconds * 1000:.1f}ms"
+
+# One-line, human readable version of MetricsCollector.summary()
+def format_timings(timings):
+    return ", ".join(f"{phase} {format_seconds(totals['seconds'])}" + (f" ({totals['count']}x)" if totals["count"] > 1 else "")
+                     for phase, totals in sorted(timings.items(), key=lambda item: -item[1]["seconds"]))
+
+# Short label for a GAM command, e.g. "create user" or "update group"
+def command_type(command_parts_list):
+    if command_parts_list[:1] == ["batch"]:
+        return "batch"
+    return " ".join(command_parts_list[:2])
+
+# The user a GAM command acts on, when it is one of the user or group membership commands
+def command_user(command_parts_list):
+    if command_parts_list[:2] in (["create", "user"], ["update", "user"]) and len(command_parts_list) > 2:
+        return command_parts_list[2]
+    if command_parts_list[:2] == ["update", "group"] and len(command_parts_list) > 5 and command_parts_list[4] == "member":
+        return command_parts_list[5]
+    return None
+
+def normalize_text(text):
+    return text.lower().strip()
+
+# Looser normalization for names people type in different ways: casefolded, without diacritics, and
+# with punctuation and runs of spaces collapsed to single spaces, so " Göteborg-Office " is "goteborg office"
+def fold_text(text):
+    decomposed = unicodedata.normalize("NFKD", (text or "").casefold())
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(re.sub(r"[^\w]+|_", " ", stripped).split())
+
+def generate_random_password(length=None):
+    if length is None:
+        length = random.randint(10, 12)
+    characters = string.ascii_letters + string.digits
+    return ''.join(random.choice(characters) for _ in range(length))
+
+# Group name endings that mark the first word of a name as a location, e.g. stockholm-office@,
+# unless the rules file lists its own under "locations"
+LOCATION_GROUP_SUFFIXES = frozenset(["office", "all", "facilities"])
+
+# Minimum trigram similarity (0 to 1) for a typed name to be taken as a known one, and for suggestions
+FUZZY_MATCH_THRESHOLD = 0.5
+FUZZY_SUGGESTION_THRESHOLD = 0.3
+
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class FuzzyMatcher:
+    """Typo-tolerant lookups in a fixed vocabulary, through an index from each trigram to the words
+    containing it. Words are compared by the Dice coefficient of their padded trigrams, so
+    "stokholm" still finds "stockholm", and prefix lookups use the sorted word list."""
+
+    def __init__(self, words):
+        self.words = sorted(set(words))
+        self.word_set = set(self.words)
+        self.word_trigrams = {}
+        self.trigram_words = {}
+        self.cache = {}
+        for word in self.words:
+            grams = self.word_trigrams[word] = trigrams(word)
+            for gram in grams:
+                self.trigram_words.setdefault(gram, []).append(word)
+
+    def __contains__(self, word):
+        return word in self.word_set
+
+    def __len__(self):
+        return len(self.words)
+
+    # (similarity, word) for the `limit` words most similar to the text, best first
+    def ranked(self, text, limit):
+        grams = trigrams(text)
+        shared = Counter(word for gram in grams for word in self.trigram_words.get(gram, ()))
+        scored = ((2 * count / (len(grams) + len(self.word_trigrams[word])), word) for word, count in shared.items())
+        return heapq.nsmallest(limit, scored, key=lambda item: (-item[0], item[1]))
+
+    # The closest word, or None when nothing is similar enough. Results are cached per text.
+    def nearest(self, text):
+        if text in self.word_set:
+            return text
+        if text not in self.cache:
+            ranked = self.ranked(text, 1)
+            self.cache[text] = ranked[0][1] if ranked and ranked[0][0] >= FUZZY_MATCH_THRESHOLD else None
+        return self.cache[text]
+
+    def with_prefix(self, prefix, limit):
+        start = bisect.bisect_left(self.words, prefix)
+        matches = []
+        for word in self.words[start:start + limit]:
+            if not word.startswith(prefix):
+                break
+            matches.append(word)
+        return matches
+
+    # Words to offer while someone is typing: those starting with the text first, then similar ones
+    def suggestions(self, text, limit=5):
+        if not text:
+            return []
+        matches = self.with_prefix(text, limit)
+        for score, word in self.ranked(text, limit):
+            if len(matches) >= limit or score < FUZZY_SUGGESTION_THRESHOLD:
+                break
+            if word not in matches:
+                matches.append(word)
+        return matches
+
+# Marks a name that with_changes() removed, in place of its new position
+REMOVED_POSITION = 0xFFFFFFFF
+
+class GroupNames:
+    """The sorted names of a GroupIndex, kept as one newline-separated string and an array of the
+    offsets where each name starts. That takes a fraction of the memory of a list of strings, and
+    it supports len(), indexing and iteration, so bisect can search it directly."""
+
+    def __init__(self, names):
+        self.text = "\n".join(names)
+        self.starts = array("I", itertools.accumulate(map((1).__add__, map(len, names)), initial=0))
+        # Lowercased text for searches. It is the same string when the names are already lowercase, as
+        # GAM prints them, and None in the rare case lowercasing changes the length of the text.
+        lowered = self.text.lower()
+        self.lower_text = self.text if lowered == self.text else lowered if len(lowered) == len(self.text) else None
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def __getitem__(self, position):
+        return self.text[self.starts[position]:self.starts[position + 1] - 1]
+
+    def __iter__(self):
+        return iter(self.text.split("\n") if len(self) else ())
+
+    # Position of the name that the character at `offset` of the text belongs to
+    def position_at(self, offset):
+        return bisect.bisect_right(self.starts, offset) - 1
+
+    # Sorted positions of the names where each of the (lowercase) tokens stands between '-', '@' or
+    # the ends of the name, ignoring case. One token is searched for as plain text, which lets the
+    # search skip ahead to it, and what comes before a match is checked afterwards; several tokens
+    # are found in a single pass over the text.
+    def positions_with_words(self, tokens):
+        text = self.text if self.lower_text is None else self.lower_text
+        flags = re.IGNORECASE if self.lower_text is None else 0
+        found = {}
+        if len(tokens) == 1:
+            token, = tokens
+            pattern = re.compile(re.escape(token) + r"(?=[-@\n]|$)", flags)
+            found[token] = {match.start() for match in pattern.finditer(text) if match.start() == 0 or text[match.start() - 1] in "\n-"}
+        elif tokens:
+            words = "|".join(re.escape(token) for token in sorted(tokens, key=len, reverse=True))
+            pattern = re.compile(r"[\n-](" + words + r")(?=[-@\n]|$)", flags)
+            # The leading newline stands for the start of the first name and moves every offset by one
+            for match in pattern.finditer("\n" + text):
+                found.setdefault(match.group(1).lower(), set()).add(match.start())
+        return {token: sorted({self.position_at(offset) for offset in offsets}) for token, offsets in found.items()}
+
+class GroupIndex:
+    """Lookup structure over the group directory, built once whenever the group list is loaded.
+
+    Group names are kept compact for tenants with 100k+ groups: the domain most groups share is
+    stored once and stripped from their names, and the names are kept sorted in one string
+    (GroupNames), so membership and prefix lookups are binary searches. The part of a name before
+    the '@' is split into tokens on '-', and each (interned) token shared by several names maps to
+    an array of their positions. Tokens of a single name, such as serial numbers, are not kept;
+    they are found by searching the names' text. Token lookups start from the smallest of those
+    arrays and then check that the tokens appear in a row, so "hr" finds hr-benefits@ but not
+    chrome@ the way a plain substring test would. Results are cached per lookup.
+    """
+
+    def __init__(self, groups, domain=None):
+        groups = list(groups)
+        if domain is None:
+            domains = Counter(group.rpartition("@")[2] for group in groups if "@" in group)
+            domain = domains.most_common(1)[0][0] if domains else ""
+        self.domain = domain
+        self.suffix = f"@{domain}" if domain else None
+        self.names = GroupNames(sorted({self.compact(group) for group in groups}))
+        self.token_cache = {}
+        self.location_names_cache = {}
+        
+        token_positions = {}
+        for position, name in enumerate(self.names):
+            for token in self.name_tokens(name):
+                token_positions.setdefault(token, []).append(position)
+        self.token_positions = {sys.intern(token): array("I", positions) for token, positions in token_positions.items() if len(positions) > 1}
+
+    # A group as it is stored: without the shared domain. Groups in other domains keep theirs.
+    def compact(self, group):
+        if self.suffix and group.endswith(self.suffix):
+            return group[:-len(self.suffix)]
+        return group
+
+    def expand(self, name):
+        return name if self.suffix is None or "@" in name else name + self.suffix
+
+    # The lowercased part of a stored name before the '@', split on '-'
+    @staticmethod
+    def local_tokens(name):
+        return tuple(name.lower().partition("@")[0].split("-"))
+
+    # Tokens are only interned once they are kept in token_positions: interning every serial number
+    # would grow the interpreter's table of interned strings for good
+    @classmethod
+    def name_tokens(cls, name):
+        return {token for token in cls.local_tokens(name) if token}
+
+    # Sorted positions of the names that have the token. A token missing from token_positions is in
+    # at most one name, which is found by searching the names' text.
+    def positions_with_token(self, token):
+        positions = self.token_positions.get(token)
+        if positions is not None:
+            return positions
+        positions = self.names.positions_with_words([token]).get(token, ())
+        return [position for position in positions if token in self.local_tokens(self.names[position])]
+
+    # A new index with some groups added and removed. Only the changed groups are tokenized; the
+    # positions of everything else are moved to where their names are in the new index. This index
+    # is not modified, so it stays valid for any lookup still using it.
+    def with_changes(self, added, removed):
+        removed = {self.compact(group) for group in removed if group in self}
+        added = sorted({self.compact(group) for group in added if group not in self})
+        index = GroupIndex([], self.domain)
+        
+        # The removed names and the places the added ones go, in order. Between them the names of
+        # this index are copied in runs, and `moved` gets the new position of each of them
+        # (REMOVED_POSITION for the removed ones).
+        changes = sorted([(bisect.bisect_left(self.names, name), 0, name) for name in added] +
+                         [(bisect.bisect_left(self.names, name), 1, name) for name in removed])
+        old_names = list(self.names)
+        names = []
+        added_positions = []
+        moved = array("I")
+        start = 0
+        for position, is_removed, name in changes:
+            moved.extend(range(len(names), len(names) + position - start))
+            names += old_names[start:position]
+            start = position
+            if is_removed:
+                moved.append(REMOVED_POSITION)
+                start += 1
+            else:
+                added_positions.append((len(names), name))
+                names.append(name)
+        moved.extend(range(len(names), len(names) + len(old_names) - start))
+        names += old_names[start:]
+        index.names = GroupNames(names)
+        
+        for token, positions in self.token_positions.items():
+            positions = array("I", map(moved.__getitem__, positions))
+            for _ in range(positions.count(REMOVED_POSITION)):
+                positions.remove(REMOVED_POSITION)
+            if positions:
+                index.token_positions[token] = positions
+        new_tokens = {}
+        for position, name in added_positions:
+            for token in self.name_tokens(name):
+                if token in index.token_positions:
+                    bisect.insort(index.token_positions[token], position)
+                else:
+                    new_tokens.setdefault(token, []).append(position)
+        # A token no two remaining groups share may be in one of the existing names
+        for token, found in self.names.positions_with_words([token for token in new_tokens if token not in self.token_positions]).items():
+            if token in new_tokens:
+                new_tokens[token] += [moved[position] for position in found
+                                      if token in self.local_tokens(self.names[position]) and moved[position] != REMOVED_POSITION]
+        for token, positions in new_tokens.items():
+            if len(positions) > 1:
+                index.token_positions[sys.intern(token)] = array("I", sorted(positions))
+        return index
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return map(self.expand, self.names)
+
+    def __contains__(self, group):
+        name = self.compact(group)
+        position = bisect.bisect_left(self.names, name)
+        return position < len(self.names) and self.names[position] == name
+
+    # Every group whose address starts with the prefix, up to `limit` of them. Stored names are
+    # found from where the part before the '@' would be inserted, so only names sharing it are read.
+    def groups_with_prefix(self, prefix, limit=None):
+        local_prefix = prefix.partition("@")[0]
+        matches = []
+        for position in range(bisect.bisect_left(self.names, local_prefix), len(self.names)):
+            name = self.names[position]
+            if not name.startswith(local_prefix) or len(matches) == limit:
+                break
+            group = self.expand(name)
+            if group.startswith(prefix):
+                matches.append(group)
+        return matches
+
+    # The words that name a location in the directory: the first token of two-token groups ending
+    # in one of the suffixes, such as stockholm-office@ and gothenburg-all@. Other first tokens
+    # (team-, project-, department prefixes) are not locations. Built on first use.
+    def location_names(self, suffixes=LOCATION_GROUP_SUFFIXES):
+        if suffixes not in self.location_names_cache:
+            names = set()
+            for name in self.names:
+                tokens = self.local_tokens(name)
+                if len(tokens) == 2 and tokens[1] in suffixes and tokens[0] and not tokens[0].isdigit():
+                    names.add(tokens[0])
+            self.location_names_cache[suffixes] = frozenset(names)
+        return self.location_names_cache[suffixes]
+
+    # Whether some group's name starts with the token, e.g. "uppsala" for uppsala-it@
+    def has_first_token(self, token):
+        return any(self.local_tokens(self.names[position])[0] == token for position in self.positions_with_token(token))
+
+    # Returns every group whose name (before the '@') has the given tokens in a row, leaving out the
+    # ones whose name matches the exclude pattern. ("core", "business") matches core-business-social@.
+    def groups_with_tokens(self, tokens, exclude=None):
+        cache_key = (tokens, exclude)
+        if cache_key in self.token_cache:
+            return self.token_cache[cache_key]
+        
+        # A token that is in no more than one name narrows the candidates down the most
+        rare = next((token for token in tokens if token not in self.token_positions), None)
+        if rare is not None:
+            candidates = self.positions_with_token(rare)
+        else:
+            candidates = min((self.token_positions[token] for token in tokens), key=len) if tokens else ()
+        width = len(tokens)
+        matches = set()
+        for position in candidates:
+            name = self.names[position]
+            name_tokens = self.local_tokens(name)
+            if (any(name_tokens[i:i + width] == tokens for i in range(len(name_tokens) - width + 1))
+                    and not (exclude and exclude.search("-".join(name_tokens)))):
+                matches.add(self.expand(name))
+        matches = self.token_cache[cache_key] = frozenset(matches)
+        return matches
+
+def as_list(value):
+    if value is None:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+# Splits a rule template once it is filled in, e.g. "core-business" or "stockholm office", into group name tokens
+def template_tokens(text):
+    return tuple(token for token in re.split(r'[-\s]+', text.lower()) if token)
+
+class GroupRule:
+    """One entry of the rules file, compiled.
+
+    `when` maps "department", "location" and "role" to the values the rule applies to, or to
+    "*" for any non-empty value. `groups` are exact group names and `tokens` add every group
+    whose name has those tokens in a row, minus the groups matching the `exclude` regex.
+    Templates can use {department}, {location} and {role}; a rule using {role} is applied
+    once for each role keyword found in the job title. `canonical(field, value)` turns the
+    values into the form resolution_key() produces, see GroupRules.canonical_value().
+    """
+
+    FIELDS = ("department", "location", "role")
+
+    def __init__(self, config, domain, canonical=None):
+        canonical = canonical or (lambda field, value: normalize_text(value))
+        self.name = config.get("name", "unnamed rule")
+        unknown = set(config.get("when", {})) - set(self.FIELDS)
+        if unknown:
+            raise ValueError(f"rule '{self.name}': unknown condition {', '.join(sorted(unknown))}")
+        self.when = {}
+        for field, values in config.get("when", {}).items():
+            if values == "*":
+                self.when[field] = None
+            else:
+                values = [values] if isinstance(values, str) else values
+                self.when[field] = frozenset(canonical(field, value) for value in values)
+        
+        self.groups = [group if "@" in group else f"{group}@{domain}" for group in as_list(config.get("groups"))]
+        self.tokens = as_list(config.get("tokens"))
+        self.exclude = re.compile(config["exclude"]) if config.get("exclude") else None
+        templates = self.groups + self.tokens
+        self.per_role = any("{role}" in template for template in templates)
+        if self.per_role and "role" not in self.when:
+            self.when["role"] = None
+        # Fail on a typo in a placeholder when the file is loaded, not when a user happens to match the rule
+        for template in templates:
+            try:
+                template.format(department="d", location="l", role="r")
+            except (KeyError, IndexError, ValueError) as e:
+                raise ValueError(f"rule '{self.name}': bad template '{template}': {e}") from None
+
+    # Whether the rule applies to a resolution_key(): every condition must hold
+    def applies(self, key):
+        dept_key, location, roles = key
+        for field, values in self.when.items():
+            if field == "role":
+                if not roles or (values is not None and values.isdisjoint(roles)):
+                    return False
+            else:
+                value = dept_key if field == "department" else location
+                if not value or (values is not None and value not in values):
+                    return False
+        return True
+
+    # The groups this rule adds for a key it applies to
+    def resolve(self, key, group_index):
+        dept_key, location, roles = key
+        variables = {"department": dept_key, "location": "-".join(location.split())}
+        if self.per_role:
+            role_values = self.when["role"]
+            bindings = [dict(variables, role=role) for role in roles if role_values is None or role in role_values]
+        else:
+            bindings = [variables]
+        
+        groups = set()
+        for binding in bindings:
+            for template in self.groups:
+                group = template.format(**binding)
+                if group in group_index:
+                    groups.add(group)
+            for template in self.tokens:
+                tokens = template_tokens(template.format(**binding))
+                if tokens:
+                    groups.update(group_index.groups_with_tokens(tokens, self.exclude))
+        return groups
+
+class GroupRules:
+    """The compiled rules file: role keyword regexes built once, and the rules indexed by the
+    department, location or role they are limited to, so a lookup only checks the rules that
+    can apply plus the unconditional ones."""
+
+    def __init__(self, config, source=None):
+        self.source = source
+        self.domain = config.get("domain", "deytech.se")
+        # Role keywords found in the job title, each with a regex (by default the keyword as a whole word)
+        self.role_patterns = {}
+        for role, pattern in config.get("roles", {}).items():
+            self.role_patterns[normalize_text(role)] = re.compile(pattern or r'\b' + re.escape(normalize_text(role)) + r'\b')
+        
+        # Other names for locations and departments, e.g. "goteborg" for "gothenburg", compared after fold_text()
+        aliases = config.get("aliases", {})
+        self.location_aliases = {fold_text(alias): fold_text(name) for alias, name in aliases.get("locations", {}).items()}
+        self.department_aliases = {fold_text(alias): fold_text(name) for alias, name in aliases.get("departments", {}).items()}
+        self.department_names = {}
+        for name, key in DEPARTMENT_KEYS.items():
+            self.department_names[fold_text(name)] = key
+            self.department_names[fold_text(key)] = key
+        self.department_matcher = FuzzyMatcher(self.department_names)
+        
+        # Known locations, and the group name endings that make a group's first word a location
+        locations = config.get("locations", {})
+        self.known_locations = {fold_text(name) for name in locations.get("names", [])}
+        self.location_group_suffixes = frozenset(fold_text(suffix) for suffix in locations.get("group_suffixes", LOCATION_GROUP_SUFFIXES))
+        self.location_matcher_cache = (None, None)
+        self.unmatched_locations = set()
+        
+        self.rules = [GroupRule(rule, self.domain, self.canonical_value) for rule in config.get("rules", [])]
+        self.unconditional = []
+        self.rules_by_field = {field: {} for field in GroupRule.FIELDS}
+        for rule in self.rules:
+            # Index each rule under its first condition that lists specific values
+            field = next((field for field in GroupRule.FIELDS if rule.when.get(field)), None)
+            if field is None:
+                self.unconditional.append(rule)
+            else:
+                for value in rule.when[field]:
+                    self.rules_by_field[field].setdefault(value, []).append(rule)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        if not isinstance(config, dict) or not isinstance(config.get("rules"), list):
+            raise ValueError("expected an object with a \"rules\" list")
+        return cls(config, source=path)
+
+    def __len__(self):
+        return len(self.rules)
+
+    # A value from a rule's `when`, folded like the keys it is compared with: "Malmö" is "malmo",
+    # "Human Resources" and "HR" are "hr". Unlike what users type, rule values are not fuzzy matched.
+    def canonical_value(self, field, value):
+        if field == "role":
+            return normalize_text(value)
+        folded = fold_text(value)
+        if field == "location":
+            return self.location_aliases.get(folded, folded)
+        folded = self.department_aliases.get(folded, folded)
+        return self.department_names.get(folded, folded)
+
+    # Department key for what was typed: a department name or key, an alias of one, or the closest one
+    # by trigrams. Anything else is kept as typed, folded.
+    def department_key(self, department):
+        folded = fold_text(department)
+        folded = self.department_aliases.get(folded, folded)
+        if not folded:
+            return ""
+        match = self.department_matcher.nearest(folded)
+        return self.department_names[match] if match else folded
+
+    # Fuzzy matcher over the known locations: those the rules file lists or names in its rules and
+    # aliases, and the location names of the group directory (GroupIndex.location_names()), minus
+    # anything that is a department. The matcher for the last index asked about is kept.
+    def location_matcher(self, group_index):
+        cached_index, matcher = self.location_matcher_cache
+        if cached_index is not group_index:
+            locations = self.known_locations | set(self.location_aliases.values()) | group_index.location_names(self.location_group_suffixes)
+            for rule in self.rules:
+                locations.update(rule.when.get("location") or ())
+            matcher = FuzzyMatcher(location for location in locations if location not in self.department_names)
+            self.location_matcher_cache = (group_index, matcher)
+        return matcher
+
+    # Location for what was typed, as the group directory spells it: after folding and aliases, the
+    # first word that is a known location, else the first word some group name starts with (uppsala
+    # for uppsala-it@) that is not a department, else the first word close to a known location.
+    # "Gothenburg office" and "Göteborg" are both "gothenburg". Anything else is "", no location, so
+    # "Sales office" or "Teams" do not pick up department or team groups; with `warn` that is logged
+    # once per location. Without a group index only folding and aliases apply.
+    def location_name(self, location, group_index=None, warn=False):
+        folded = fold_text(location)
+        folded = self.location_aliases.get(folded, folded)
+        words = [self.location_aliases.get(word, word) for word in folded.split()]
+        if not words or group_index is None:
+            return " ".join(words)
+        matcher = self.location_matcher(group_index)
+        for word in words:
+            if word in matcher:
+                return word
+        for word in words:
+            if word not in self.department_names and not word.isdigit() and group_index.has_first_token(word):
+                return word
+        for word in words:
+            match = matcher.nearest(word)
+            if match:
+                return match
+        if warn and folded not in self.unmatched_locations:
+            self.unmatched_locations.add(folded)
+            log.warning(f"Location {location.strip()!r} matches no known location or group, so no location groups are added for it")
+        return ""
+
+    # Locations to offer while a location is being typed, including the ones reached through an alias
+    def location_suggestions(self, location, group_index, limit=5):
+        folded = fold_text(location)
+        if not folded:
+            return []
+        suggestions = [name for alias, name in sorted(self.location_aliases.items()) if alias.startswith(folded)]
+        suggestions += self.location_matcher(group_index).suggestions(folded, limit)
+        return list(dict.fromkeys(suggestions))[:limit]
+
+    def match_roles(self, job_title_clean):
+        return tuple(role for role, pattern in self.role_patterns.items() if pattern.search(job_title_clean))
+
+    # The rules that apply to a resolution_key()
+    def applicable(self, key):
+        dept_key, location, roles = key
+        candidates = self.unconditional + self.rules_by_field["department"].get(dept_key, []) + self.rules_by_field["location"].get(location, [])
+        for role in roles:
+            candidates += self.rules_by_field["role"].get(role, [])
+        # A rule indexed under several roles is only checked once
+        unique = {id(rule): rule for rule in candidates}
+        return [rule for rule in unique.values() if rule.applies(key)]
+
+    def resolve(self, key, group_index):
+        groups = set()
+        for rule in self.applicable(key):
+            groups.update(rule.resolve(key, group_index))
+        return groups
+
+group_rules_lock = threading.Lock()
+loaded_group_rules = {"rules": None, "mtime": None, "checked_at": 0.0}
+
+# Returns the compiled rules from GROUP_RULES_FILE, reloading them when the file has changed. A changed
+# file that does not load is logged and the previous rules stay in use until it is fixed.
+def current_group_rules():
+    with group_rules_lock:
+        rules = loaded_group_rules["rules"]
+        now = time.monotonic()
+        if rules is not None and now - loaded_group_rules["checked_at"] < GROUP_RULES_CHECK_INTERVAL:
+            return rules
+        loaded_group_rules["checked_at"] = now
+        
+        try:
+            mtime = os.stat(GROUP_RULES_FILE).st_mtime_ns
+        except OSError as e:
+            if rules is None:
+                raise RuntimeError(f"Could not read the group rules file {GROUP_RULES_FILE}: {e}") from e
+            return rules
+        if mtime == loaded_group_rules["mtime"]:
+            return rules
+        
+        loaded_group_rules["mtime"] = mtime
+        try:
+            new_rules = GroupRules.load(GROUP_RULES_FILE)
+        except (OSError, ValueError, re.error) as e:
+            if rules is None:
+                raise RuntimeError(f"Could not load the group rules from {GROUP_RULES_FILE}: {e}") from e
+            log.error(f"Could not reload the group rules from {GROUP_RULES_FILE}, keeping the previous ones: {e}")
+            return rules
+        
+        loaded_group_rules["rules"] = new_rules
+        log.info(f"{'Reloaded' if rules is not None else 'Loaded'} {len(new_rules)} group rules from {GROUP_RULES_FILE}")
+        return new_rules
+
+# The normalized inputs that decide which groups a user gets: (department key, location, role keywords
+# found in the job title). Department and location are matched leniently, see GroupRules.department_key()
+# and GroupRules.location_name(). Users with the same key always get the same groups. With `warn`, a
+# location that matches nothing is logged, for the paths that provision users.
+def resolution_key(department, location, job_title, rules=None, group_index=None, warn=False):
+    rules = rules or current_group_rules()
+    return rules.department_key(department), rules.location_name(location, group_index, warn), rules.match_roles(normalize_text(job_title or ""))
+
+# Determines which groups a user should be added to based on department, location, and job title
+def determine_groups_to_add(department, location, job_title, all_groups):
+    group_index = all_groups if isinstance(all_groups, GroupIndex) else GroupIndex(all_groups)
+    rules = current_group_rules()
+    return resolve_groups(resolution_key(department, location, job_title, rules, group_index, warn=True), group_index, rules)
+
+# Resolves the groups for one resolution_key() against the group index
+def resolve_groups(key, group_index, rules=None):
+    start = time.perf_counter()
+    groups_to_add = (rules or current_group_rules()).resolve(key, group_index)
+    record_metric("group_resolution", time.perf_counter() - start, groups=len(groups_to_add), directory_size=len(group_index))
+    return sorted(groups_to_add)
+
+class GroupResolver:
+    """Resolves groups for many users against one group list, resolving each distinct
+    resolution_key() only once. Most users in a bulk run share a handful of keys.
+    The remembered results are dropped when the rules file is reloaded. With maxsize set only
+    that many results are kept, least recently used first out, for long-lived resolvers such
+    as the live preview in the window."""
+
+    def __init__(self, all_groups, maxsize=None):
+        self.group_index = all_groups if isinstance(all_groups, GroupIndex) else GroupIndex(all_groups)
+        self.maxsize = maxsize
+        self.rules = None
+        self.resolved = OrderedDict()
+
+    def resolve(self, department, location, job_title, warn=True):
+        rules = current_group_rules()
+        if rules is not self.rules:
+            self.rules = rules
+            self.resolved = OrderedDict()
+        key = resolution_key(department, location, job_title, rules, self.group_index, warn)
+        groups = self.resolved.get(key)
+        if groups is None:
+            groups = self.resolved[key] = tuple(resolve_groups(key, self.group_index, rules))
+            if self.maxsize is not None and len(self.resolved) > self.maxsize:
+                self.resolved.popitem(last=False)
+        elif self.maxsize is not None:
+            self.resolved.move_to_end(key)
+        return list(groups)
+
+# Batch version of determine_groups_to_add: one list of groups per user dict
+def determine_groups_for_users(users, all_groups):
+    resolver = GroupResolver(all_groups)
+    groups = [resolver.resolve(user["department"], user["location"], user["job_title"]) for user in users]
+    log.info(f"Resolved groups for {len(users)} users with {len(resolver.resolved)} distinct resolutions")
+    return groups
+
+# Lists every group email in Google Workspace through GAM. The output is read line by line while GAM
+# is still running, so only the final list is held in memory; progress, when given, is called with
+# the number of groups read so far every GROUP_FETCH_PROGRESS_EVERY groups.
+GROUP_FETCH_PROGRESS_EVERY = 500
+
+def fetch_groups_from_gam(progress=None):
+    command = GAM_COMMAND + ['print', 'groups', 'email']
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    
+    # stderr is drained on its own thread so a chatty GAM cannot block on a full pipe
+    stderr_chunks = []
+    stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    stderr_reader.start()
+    
+    groups = []
+    stdout_bytes = 0
+    for line in process.stdout:
+        stdout_bytes += len(line)
+        group = line.strip()
+        # Skip empty lines and the header (if any)
+        if not group or group == "email":
+            continue
+        groups.append(group)
+        if progress and len(groups) % GROUP_FETCH_PROGRESS_EVERY == 0:
+            progress(len(groups))
+    
+    process.wait()
+    stderr_reader.join()
+    stderr = "".join(stderr_chunks)
+    record_metric("group_fetch", time.perf_counter() - start, exit_code=process.returncode, stdout_bytes=stdout_bytes, stderr_bytes=len(stderr), groups=len(groups))
+    if process.returncode != 0:
+        raise RuntimeError(stderr.strip() or f"gam exited with code {process.returncode}")
+    if progress and len(groups) % GROUP_FETCH_PROGRESS_EVERY:
+        progress(len(groups))
+    return groups
+
+# Reads the cache file as a dict with "groups", "fetched_at" and "full_fetched_at", or None if there is no usable cache
+def read_group_cache(path=GROUP_CACHE_FILE):
+    try:
+        with open(path, encoding="utf-8") as f:
+            cache = json.load(f)
+        if not isinstance(cache["groups"], list) or not isinstance(cache["fetched_at"], (int, float)):
+            return None
+        return cache
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+# Reads the cached group list, returns (groups, fetched_at) or (None, None) if there is no usable cache
+def load_group_cache(path=GROUP_CACHE_FILE):
+    cache = read_group_cache(path)
+    if cache is None:
+        return None, None
+    return cache["groups"], cache["fetched_at"]
+
+# Writes the group list to the cache file, replacing the old file atomically. fetched_at is when the
+# list was last brought up to date and full_fetched_at when the whole directory was last listed.
+def save_group_cache(groups, path=GROUP_CACHE_FILE, fetched_at=None, full_fetched_at=None):
+    fetched_at = time.time() if fetched_at is None else fetched_at
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"fetched_at": fetched_at, "full_fetched_at": fetched_at if full_fetched_at is None else full_fetched_at, "groups": groups}, f)
+    os.replace(tmp_path, path)
+
+# Groups created and deleted since the given time, read from the admin audit log with one GAM call.
+# Returns (added, removed); the latest event wins for a group that was created and deleted again.
+def fetch_group_changes(since):
+    start_time = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(since))
+    result = run_gam_command(["report", "admin", "start", start_time, "event", ",".join(GROUP_CHANGE_EVENTS)])
+    if not result.ok:
+        raise RuntimeError(result.stderr.strip() or "could not read the admin audit log")
+    
+    events = []
+    for row in csv.DictReader(io.StringIO(result.stdout)):
+        row = {key.lower(): (value or "").strip() for key, value in row.items() if key}
+        event = row.get("name") or row.get("events.0.name", "")
+        if row.get("group_email") and event in GROUP_CHANGE_EVENTS:
+            events.append((row.get("id.time", ""), event, row["group_email"]))
+    
+    added, removed = set(), set()
+    for _, event, group in sorted(events):
+        if event == "CREATE_GROUP":
+            added.add(group)
+            removed.discard(group)
+        else:
+            removed.add(group)
+            added.discard(group)
+    return added, removed
+
+# Applies group changes to a group list, comparing emails case-insensitively.
+# Returns (new list, groups actually added, groups actually removed).
+def merge_group_changes(groups, added, removed):
+    removed_keys = {group.lower() for group in removed}
+    kept = [group for group in groups if group.lower() not in removed_keys]
+    kept_keys = {group.lower() for group in kept}
+    new_groups = sorted(group for group in added if group.lower() not in kept_keys)
+    return kept + new_groups, new_groups, [group for group in groups if group.lower() in removed_keys]
+
+GroupDirectorySync = namedtuple("GroupDirectorySync", ["groups", "added", "removed", "full", "fetched_at", "previous_fetched_at"])
+
+# Brings the cached group list up to date and saves it. Only the changes since the last refresh are
+# read, unless there is no cache yet, the last full listing is older than GROUP_FULL_REFRESH_INTERVAL,
+# full is set, or the audit log cannot be read; then the whole directory is listed. added and removed
+# are None after a full listing. They are the changes since the cache as it was at previous_fetched_at,
+# so a caller holding a list from another time must use groups instead.
+def sync_group_directory(full=False, progress=None, path=GROUP_CACHE_FILE):
+    cache = read_group_cache(path)
+    started = time.time()
+    full_fetched_at = cache.get("full_fetched_at") if cache else None
+    if not full and full_fetched_at is not None and started - full_fetched_at < GROUP_FULL_REFRESH_INTERVAL:
+        start = time.perf_counter()
+        try:
+            changes = fetch_group_changes(cache["fetched_at"] - GROUP_CHANGES_OVERLAP)
+        except (OSError, RuntimeError) as e:
+            log.warning(f"Could not read the group changes, listing all groups instead: {e}")
+        else:
+            groups, added, removed = merge_group_changes(cache["groups"], *changes)
+            record_metric("group_changes", time.perf_counter() - start, added=len(added), removed=len(removed), groups=len(groups))
+            log.info(f"Group list updated: {len(added)} added, {len(removed)} removed, {len(groups)} groups")
+            write_group_cache(groups, path, started, full_fetched_at)
+            return GroupDirectorySync(groups, added, removed, False, started, cache["fetched_at"])
+    
+    groups = fetch_groups_from_gam(progress)
+    write_group_cache(groups, path, started, started)
+    return GroupDirectorySync(groups, None, None, True, started, cache["fetched_at"] if cache else None)
+
+# save_group_cache() for callers that can carry on without the cache
+def write_group_cache(groups, path=GROUP_CACHE_FILE, fetched_at=None, full_fetched_at=None):
+    try:
+        save_group_cache(groups, path, fetched_at, full_fetched_at)
+    except OSError as e:
+        log.warning(f"Could not write group cache: {e}")
+
+def is_group_cache_stale(fetched_at, ttl=GROUP_CACHE_TTL):
+    return fetched_at is None or time.time() - fetched_at > ttl
+
+# Outcome of a single GAM command; returncode is None when GAM could not be started
+class GamResult(namedtuple("GamResult", ["command", "returncode", "stdout", "stderr"])):
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+# Command line for display, with the value after "password" masked
+def format_command(command_to_run):
+    masked = list(command_to_run)
+    for i, part in enumerate(masked[:-1]):
+        if part == "password":
+            masked[i + 1] = "********"
+    return ' '.join(masked)
+
+# Keeps large listings (e.g. every user in the domain) out of the log
+def shorten_output(output, limit=2000):
+    output = output.rstrip()
+    if len(output) <= limit:
+        return output
+    return output[:limit] + f"\n... ({len(output) - limit} more characters)"
+
+# Executes Google Admin SDK commands through GAM
+def run_gam_command(command_parts_list):
+    command_to_run = GAM_COMMAND + command_parts_list
+    command_text = format_command(command_to_run)
+    start = time.perf_counter()
+    pool = gam_worker_pool()
+    try:
+        if pool is not None:
+            # The command runs inside a worker that already has GAM loaded, not in a new process
+            log.info(f"Executing on a GAM worker: {format_command(['gam'] + command_parts_list)}")
+            try:
+                returncode, stdout, stderr = pool.run(command_parts_list)
+            except GamWorkerStartError as e:
+                log.warning(f"{e}. Starting GAM for every command instead.")
+                close_gam_worker_pool(disable=True)
+                pool = None
+        if pool is None:
+            log.info(f"Executing: {command_text}")
+            process = subprocess.Popen(command_to_run, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            stdout, stderr = process.communicate()
+            returncode = process.returncode
+        if returncode == 0:
+            log.info(f"Success! {command_text}" + (f"\n{shorten_output(stdout)}" if stdout.strip() else ""))
+        else:
+            log.error(f"Error! (exit code {returncode}) {command_text}"
+                      + (f"\n{shorten_output(stderr)}" if stderr.strip() else "")
+                      + (f"\nOutput:\n{shorten_output(stdout)}" if stdout.strip() else ""))
+        result = GamResult(command_parts_list, returncode, stdout, stderr)
+    except FileNotFoundError:
+        log.error("GAM not found. Ensure GAM is installed and available in PATH.")
+        result = GamResult(command_parts_list, None, "", "GAM not found. Ensure GAM is installed and available in PATH.")
+    except Exception as e:
+        log.error(f"Unexpected error: {e}")
+        result = GamResult(command_parts_list, None, "", f"Unexpected error: {e}")
+    
+    record_metric("gam_command", time.perf_counter() - start, command_type=command_type(command_parts_list), user=command_user(command_parts_list),
+                  exit_code=result.returncode, stdout_bytes=len(result.stdout), stderr_bytes=len(result.stderr), pooled=pool is not None)
+    return result
+
+class GamWorkerStartError(RuntimeError):
+    """A gam_worker.py process could not load GAM."""
+
+class GamWorkerPool:
+    """Long-lived gam_worker.py processes that keep GAM loaded and run one command at a time each.
+
+    Commands and results travel over the workers' stdin and stdout as JSON lines. Workers are
+    started on demand, up to `size`, and each is used by one thread at a time. A worker that
+    dies is replaced on a later command.
+    """
+
+    def __init__(self, module, size):
+        self.module = module
+        self.size = max(1, size)
+        self.idle = queue.LifoQueue()
+        self.workers = []
+        self.lock = threading.Lock()
+
+    # Starts the worker for slot `number` (1 to size) of the pool
+    def start_worker(self, number):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gam_worker.py")
+        process = subprocess.Popen([sys.executable, script, self.module], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   text=True, encoding="utf-8", bufsize=1)
+        hello = json.loads(process.stdout.readline() or '{"error": "the worker exited while starting"}')
+        if "error" in hello:
+            process.wait()
+            raise GamWorkerStartError(f"GAM worker for '{self.module}' could not start: {hello['error']}")
+        log.info(f"Started GAM worker {number} of {self.size} (pid {process.pid})")
+        return process
+
+    # Returns an idle worker, starting a new one while there are fewer than `size`
+    def acquire(self):
+        while True:
+            with self.lock:
+                start_new = self.idle.empty() and len(self.workers) < self.size
+                if start_new:
+                    self.workers.append(None)
+                    number = len(self.workers)
+            if not start_new:
+                process = self.idle.get()
+                # None is left behind by a worker that died, so another one may be started
+                if process is None:
+                    continue
+                if process.poll() is None:
+                    return process
+                with self.lock:
+                    self.workers.remove(process)
+                continue
+            
+            try:
+                process = self.start_worker(number)
+            except Exception:
+                with self.lock:
+                    self.workers.remove(None)
+                raise
+            with self.lock:
+                self.workers[self.workers.index(None)] = process
+            return process
+
+    def release(self, process):
+        if process.poll() is None:
+            self.idle.put(process)
+            return
+        with self.lock:
+            self.workers.remove(process)
+        self.idle.put(None)
+
+    # Runs one command on a worker and returns (returncode, stdout, stderr). A command that could
+    # not even be sent, because the worker had died, is sent to another worker once.
+    def run(self, command_parts_list):
+        for attempt in range(2):
+            process = self.acquire()
+            try:
+                process.stdin.write(json.dumps({"args": command_parts_list}) + "\n")
+                process.stdin.flush()
+            except BrokenPipeError:
+                process.wait()
+                self.release(process)
+                if attempt:
+                    raise
+                continue
+            
+            try:
+                line = process.stdout.readline()
+                if not line:
+                    raise RuntimeError(f"GAM worker (pid {process.pid}) exited with code {process.wait()}")
+                reply = json.loads(line)
+            except ValueError:
+                process.kill()
+                process.wait()
+                raise
+            finally:
+                self.release(process)
+            return reply["returncode"], reply["stdout"], reply["stderr"]
+
+    def close(self):
+        with self.lock:
+            workers = [process for process in self.workers if process is not None]
+            self.workers = []
+        for process in workers:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+        for process in workers:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+gam_pool_lock = threading.Lock()
+gam_pool_state = {"pool": None, "disabled": False}
+
+# The shared worker pool when GAM_LIBRARY is set, created on first use and closed when the program exits
+def gam_worker_pool():
+    if not GAM_LIBRARY:
+        return None
+    with gam_pool_lock:
+        if gam_pool_state["pool"] is None and not gam_pool_state["disabled"]:
+            gam_pool_state["pool"] = GamWorkerPool(GAM_LIBRARY, GAM_POOL_SIZE)
+            atexit.register(gam_pool_state["pool"].close)
+        return gam_pool_state["pool"]
+
+# Stops the pool's workers; the next command starts new ones, unless disable is set
+def close_gam_worker_pool(disable=False):
+    with gam_pool_lock:
+        pool, gam_pool_state["pool"] = gam_pool_state["pool"], None
+        gam_pool_state["disabled"] = disable
+    if pool is not None:
+        pool.close()
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` acquisitions per second, with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Blocks until a token is available
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# Shared by every worker pool so the whole app stays under one request rate
+GAM_RATE_LIMITER = TokenBucket(GAM_RATE_LIMIT)
+
+def is_quota_error(result):
+    return not result.ok and bool(QUOTA_ERROR_PATTERN.search(result.stderr or ""))
+
+# Runs one GAM command under the rate limiter, retrying with exponential backoff while it hits quota errors
+def run_gam_command_with_retry(command_parts_list, limiter=None, max_retries=GAM_MAX_RETRIES):
+    limiter = limiter or GAM_RATE_LIMITER
+    attempt = 0
+    while True:
+        limiter.acquire()
+        result = run_gam_command(command_parts_list)
+        if not is_quota_error(result) or attempt >= max_retries:
+            return result
+        delay = min(GAM_RETRY_MAX_DELAY, GAM_RETRY_BASE_DELAY * 2 ** attempt) * random.uniform(0.5, 1.0)
+        log.warning(f"Quota error, retrying in {delay:.1f}s (attempt {attempt + 1} of {max_retries}): {format_command(['gam'] + command_parts_list)}")
+        time.sleep(delay)
+        record_metric("retry_wait", delay, command_type=command_type(command_parts_list), user=command_user(command_parts_list), attempt=attempt + 1)
+        attempt += 1
+
+# Runs independent GAM commands concurrently and returns their results in the same order
+def run_gam_commands_parallel(commands, workers=GAM_WORKERS, limiter=None):
+    if len(commands) <= 1 or workers <= 1:
+        return [run_gam_command_with_retry(command, limiter) for command in commands]
+    with ThreadPoolExecutor(max_workers=min(workers, len(commands))) as pool:
+        return list(pool.map(lambda command: run_gam_command_with_retry(command, limiter), commands))
+
+class GamBatch:
+    """Collects GAM commands and runs them through a single `gam batch` process.
+
+    Each command line redirects its own stdout and stderr to separate files, so the
+    outcome of every command can still be reported on its own. `barrier()` inserts a
+    `commit-batch` line, which makes GAM finish everything queued before it first.
+    With GWS_GAM_BATCH=0, or when the GAM worker pool is in use and GAM is already
+    loaded, the commands between barriers run on the thread pool instead.
+    Commands that fail on a quota error are retried with backoff in both modes.
+    """
+
+    def __init__(self):
+        self.steps = []
+
+    def __len__(self):
+        return sum(1 for step in self.steps if step is not None)
+
+    def add(self, command_parts_list):
+        self.steps.append(list(command_parts_list))
+
+    def barrier(self):
+        self.steps.append(None)
+
+    @property
+    def commands(self):
+        return [step for step in self.steps if step is not None]
+
+    # Splits the queued commands at each barrier; commands within a segment do not depend on each other
+    def segments(self):
+        segments = [[]]
+        for step in self.steps:
+            if step is None:
+                segments.append([])
+            else:
+                segments[-1].append(step)
+        return [segment for segment in segments if segment]
+
+    # Runs the queued commands and returns one GamResult per command, in the order they were added
+    def run(self):
+        if not self.commands:
+            return []
+        if not GAM_BATCH_ENABLED or gam_worker_pool() is not None:
+            results = []
+            for segment in self.segments():
+                results += run_gam_commands_parallel(segment)
+            return results
+        
+        results = self.run_as_batch()
+        
+        # Lines that ran into the API quota are retried on their own, with backoff
+        retry_positions = [i for i, result in enumerate(results) if is_quota_error(result)]
+        if retry_positions:
+            retried = run_gam_commands_parallel([results[i].command for i in retry_positions])
+            for i, result in zip(retry_positions, retried):
+                results[i] = result
+        return results
+
+    def run_as_batch(self):
+        with tempfile.TemporaryDirectory(prefix="gam_batch_") as work_dir:
+            batch_lines = []
+            outputs = []
+            for step in self.steps:
+                if step is None:
+                    batch_lines.append("commit-batch")
+                    continue
+                n = len(outputs)
+                out_path = os.path.join(work_dir, f"{n}.out")
+                err_path = os.path.join(work_dir, f"{n}.err")
+                outputs.append((step, out_path, err_path))
+                batch_lines.append(shlex.join(["gam", "redirect", "stdout", out_path, "redirect", "stderr", err_path] + step))
+            
+            batch_file = os.path.join(work_dir, "commands.gam")
+            with open(batch_file, "w", encoding="utf-8") as f:
+                f.write("\n".join(batch_lines) + "\n")
+            
+            start = time.perf_counter()
+            batch_result = run_gam_command(["batch", batch_file])
+            users = sorted({command_user(command) for command, _, _ in outputs} - {None})
+            record_metric("gam_batch", time.perf_counter() - start, commands=len(outputs), users=users, exit_code=batch_result.returncode)
+            if batch_result.returncode is None:
+                return [GamResult(command, None, "", batch_result.stderr) for command, _, _ in outputs]
+            
+            results = [read_batch_output(command, out_path, err_path) for command, out_path, err_path in outputs]
+            for result in results:
+                # GAM does not time individual batch lines, only their outcome is recorded
+                record_metric("gam_batch_line", None, command_type=command_type(result.command), user=command_user(result.command),
+                              exit_code=result.returncode, stdout_bytes=len(result.stdout), stderr_bytes=len(result.stderr))
+                if result.ok:
+                    log.info(f"Success! {format_command(['gam'] + result.command)}")
+                else:
+                    log.error(f"Error! {format_command(['gam'] + result.command)}\n{result.stderr.rstrip()}")
+            return results
+
+# Turns the redirected output of one batch line into a GamResult. GAM does not report exit codes
+# per batch line, so a command counts as failed when it never ran or wrote an ERROR to stderr.
+def read_batch_output(command, out_path, err_path):
+    try:
+        with open(out_path, encoding="utf-8", errors="replace") as f:
+            stdout = f.read()
+        with open(err_path, encoding="utf-8", errors="replace") as f:
+            stderr = f.read()
+    except OSError:
+        return GamResult(command, None, "", "Command was not run by gam batch.")
+    returncode = 1 if "ERROR" in stderr else 0
+    return GamResult(command, returncode, stdout, stderr)
+
+# One-line summary of a failed command that never includes the rest of its arguments (e.g. the password)
+def describe_failure(result):
+    return f"{' '.join(result.command[:4])}: {(result.stderr.strip() or 'no output').splitlines()[-1]}"
+
+def is_membership_add(command_parts_list):
+    return command_parts_list[:2] == ["update", "group"] and command_parts_list[3:5] == ["add", "member"]
+
+def is_membership_delete(command_parts_list):
+    return command_parts_list[:2] == ["update", "group"] and command_parts_list[3:5] == ["delete", "member"]
+
+# True when the command succeeded, or when it failed only because the membership was already as wanted
+def is_effectively_done(result):
+    if result.ok:
+        return True
+    if is_membership_add(result.command):
+        return bool(ALREADY_MEMBER_PATTERN.search(result.stderr or ""))
+    if is_membership_delete(result.command):
+        return bool(NOT_MEMBER_PATTERN.search(result.stderr or ""))
+    return False
+
+class ProvisioningJournal:
+    """SQLite journal of the GAM operations planned and completed for each user.
+
+    Operations are written as planned before they run and marked done or failed afterwards, so
+    after a crash or a partial failure a rerun can skip everything that already went through.
+    A user's `create user` is one operation regardless of its arguments, so an account is never
+    created twice; every other operation is identified by its full (password masked) command line.
+    """
+
+    def __init__(self, path=JOURNAL_FILE):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        # Users whose create an earlier run planned but never recorded, see record()
+        self.interrupted_creates = set()
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS operations ("
+                " user TEXT NOT NULL, operation TEXT NOT NULL, status TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT, updated_at REAL NOT NULL,"
+                " PRIMARY KEY (user, operation))"
+            )
+
+    @staticmethod
+    def operation_key(command_parts_list):
+        if command_parts_list[:2] == ["create", "user"]:
+            return "create user"
+        return format_command(command_parts_list)
+
+    def is_done(self, user, command_parts_list):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status FROM operations WHERE user = ? AND operation = ?",
+                (user.lower(), self.operation_key(command_parts_list)),
+            ).fetchone()
+        return row is not None and row[0] == "done"
+
+    # Records commands as planned before they run; operations that are already done stay done
+    def plan(self, user, commands):
+        now = time.time()
+        with self.lock, self.conn:
+            if any(self.operation_key(command) == "create user" for command in commands):
+                row = self.conn.execute(
+                    "SELECT status FROM operations WHERE user = ? AND operation = 'create user'", (user.lower(),),
+                ).fetchone()
+                if row is not None and row[0] == "planned":
+                    self.interrupted_creates.add(user.lower())
+            self.conn.executemany(
+                "INSERT INTO operations (user, operation, status, updated_at) VALUES (?, ?, 'planned', ?)"
+                " ON CONFLICT (user, operation) DO UPDATE SET status = 'planned', updated_at = excluded.updated_at"
+                " WHERE status != 'done'",
+                [(user.lower(), self.operation_key(command), now) for command in commands],
+            )
+
+    # Marks a command done or failed and returns its result as journaled. A run that stopped after GAM
+    # created an account but before the create was recorded leaves it planned; when the create is
+    # sent again and the account already exists, that is the earlier create, so it counts as done.
+    def record(self, user, result):
+        done = is_effectively_done(result)
+        if (not done and self.operation_key(result.command) == "create user" and user.lower() in self.interrupted_creates
+                and USER_EXISTS_PATTERN.search(result.stderr or "")):
+            log.info(f"{user} was already created by an earlier run that stopped before recording it")
+            result = result._replace(returncode=0)
+            done = True
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE operations SET status = ?, attempts = attempts + 1, last_error = ?, updated_at = ?"
+                " WHERE user = ? AND operation = ?",
+                ("done" if done else "failed", None if done else describe_failure(result), time.time(),
+                 user.lower(), self.operation_key(result.command)),
+            )
+            if result.command[:2] == ["create", "user"]:
+                self.interrupted_creates.discard(user.lower())
+        return result
+
+    # Drops everything recorded for a user, e.g. after their account was deleted and must be created again
+    def forget(self, user):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM operations WHERE user = ?", (user.lower(),))
+
+    def close(self):
+        self.conn.close()
+
+# Builds the GAM commands that create a user: the account itself, then the profile updates and group memberships
+def build_user_commands(data, org_unit_path, groups):
+    create_cmd = [
+        "create", "user", data["email"],
+        "firstname", data["given_name"],
+        "lastname", data["family_name"],
+        "password", data["password"],
+        "changepassword", "true" if data["change_password"] == "on" else "false",
+        "org", org_unit_path
+    ]
+    
+    # This updates additional user properties in separate commands
+    update_cmds = []
+    if data["job_title"] or data["department"] or data["location"]:
+        cmd = ["update", "user", data["email"], "organization"]
+        if data["job_title"]: cmd += ["title", data["job_title"]]
+        if data["department"]: cmd += ["department", data["department"]]
+        if data["location"]: cmd += ["location", data["location"]]
+        update_cmds.append(cmd)
+    
+    if data["phone"]:
+        update_cmds.append(["update", "user", data["email"], "phones", "type", "work", "value", data["phone"]])
+    
+    if data["manager_email"]:
+        update_cmds.append(["update", "user", data["email"], "manager", data["manager_email"]])
+    
+    group_cmds = [["update", "group", group, "add", "member", data["email"]] for group in groups]
+    return create_cmd, update_cmds, group_cmds
+
+# Queues everything for one user in a GamBatch; the updates and group additions wait for the create
+def build_user_batch(data, groups):
+    create_cmd, update_cmds, group_cmds = build_user_commands(data, f"/{data['department']}", groups)
+    batch = GamBatch()
+    batch.add(create_cmd)
+    batch.barrier()
+    for cmd in update_cmds + group_cmds:
+        batch.add(cmd)
+    return batch
+
+# True when each GAM command is run on its own (GWS_GAM_BATCH=0, or GAM already loaded in the worker
+# pool), so the provisioning pipeline can schedule them; otherwise users go through `gam batch` files
+def gam_commands_run_individually():
+    return not GAM_BATCH_ENABLED or gam_worker_pool() is not None
+
+# The journal keeps a user's create as done for good, but the account may have been deleted since,
+# e.g. for an employee who is now returning. Only users whose create the journal has are looked up,
+# one `gam print users query` each, GAM_WORKERS at a time, and everything recorded for those who no
+# longer exist is forgotten, so they are provisioned again. Called once per run, before any command
+# is sent. When a lookup fails the journal is trusted. Returns the forgotten emails.
+def forget_deleted_accounts(emails, journal):
+    recorded = [email for email in emails if journal.is_done(email, ["create", "user", email])]
+    if not recorded:
+        return []
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(GAM_WORKERS, len(recorded)))) as executor:
+            found = list(executor.map(fetch_user_org_fields, recorded))
+    except (OSError, RuntimeError) as e:
+        log.warning(f"Could not check that the journaled accounts still exist, trusting the journal: {e}")
+        return []
+
+    deleted = [email for email, users in zip(recorded, found) if email.lower() not in users]
+    for email in deleted:
+        log.info(f"{email} was created by an earlier run but no longer exists, provisioning them again")
+        journal.forget(email)
+    return deleted
+
+# Runs the commands of several users: every user's create first, then their remaining commands.
+# plans holds (email, create command, other commands) per user. Commands the journal has already
+# completed are skipped. on_result(plan index, results) is called as each user finishes. Returns,
+# per plan, the GamResults of the commands that actually ran.
+def run_user_commands(plans, journal=None, on_result=None):
+    if gam_commands_run_individually():
+        return run_user_pipeline(plans, journal, on_result)
+    
+    batch = GamBatch()
+    owners = []
+    for stage in ("create", "rest"):
+        for n, (email, create_cmd, other_cmds) in enumerate(plans):
+            for cmd in ([create_cmd] if stage == "create" else other_cmds):
+                if journal is None or not journal.is_done(email, cmd):
+                    batch.add(cmd)
+                    owners.append(n)
+        if stage == "create":
+            batch.barrier()
+    
+    if journal is not None:
+        for n, (email, _, _) in enumerate(plans):
+            journal.plan(email, [cmd for owner, cmd in zip(owners, batch.commands) if owner == n])
+    
+    results = [[] for _ in plans]
+    for owner, result in zip(owners, batch.run()):
+        if journal is not None:
+            result = journal.record(plans[owner][0], result)
+        results[owner].append(result)
+    if on_result:
+        for n, user_results in enumerate(results):
+            on_result(n, user_results)
+    return results
+
+# Provisions many users as one small dependency graph each: the `create user` first, then all of the
+# user's updates and group additions at once, since those only need the account to exist. Different
+# users' commands run alongside each other, at most `concurrency` at a time and within the rate
+# limiter, and no user waits for another user's create. When a create fails for any reason other than
+# the account already existing, that user's other commands are not sent; the journal keeps them
+# planned for the next run. Yields (plan index, GamResults) as each user finishes.
+async def provisioning_pipeline(plans, journal=None, concurrency=GAM_WORKERS, limiter=None):
+    import asyncio
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        async def run(email, cmd):
+            result = await loop.run_in_executor(executor, run_gam_command_with_retry, cmd, limiter)
+            if journal is not None:
+                result = journal.record(email, result)
+            return result
+        
+        async def provision(n, email, create_cmd, other_cmds):
+            create_pending = journal is None or not journal.is_done(email, create_cmd)
+            other_pending = [cmd for cmd in other_cmds if journal is None or not journal.is_done(email, cmd)]
+            if journal is not None:
+                journal.plan(email, ([create_cmd] if create_pending else []) + other_pending)
+            
+            results = []
+            if create_pending:
+                result = await run(email, create_cmd)
+                results.append(result)
+                if not result.ok and not USER_EXISTS_PATTERN.search(result.stderr or ""):
+                    if other_pending:
+                        log.warning(f"Skipping {len(other_pending)} commands for {email} because the account could not be created")
+                    return n, results
+            results += await asyncio.gather(*(run(email, cmd) for cmd in other_pending))
+            return n, results
+        
+        tasks = [asyncio.ensure_future(provision(n, *plan)) for n, plan in enumerate(plans)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            for task in tasks:
+                task.cancel()
+
+# Runs provisioning_pipeline() from synchronous code, such as a worker thread of the window.
+# asyncio is only imported here, since importing it takes longer than the rest of a headless startup.
+def run_user_pipeline(plans, journal=None, on_result=None):
+    import asyncio
+    
+    async def collect():
+        results = [[] for _ in plans]
+        async for n, user_results in provisioning_pipeline(plans, journal):
+            results[n] = user_results
+            if on_result:
+                on_result(n, user_results)
+        return results
+    return asyncio.run(collect())
+
+# Overall outcome for one user from the results of the commands that ran for them
+def provisioning_status(results):
+    if not results:
+        return "unchanged"
+    failed = [result for result in results if not is_effectively_done(result)]
+    if any(result.command[:2] == ["create", "user"] for result in failed):
+        return "failed"
+    return "partial" if failed else "created"
+
+# Creates one user with all their updates and group memberships. With a journal, steps completed by
+# an earlier run are skipped, unless the account has been deleted since. Returns the GamResult of
+# every command that ran and the time spent per phase.
+def provision_user(data, groups, journal=None):
+    create_cmd, update_cmds, group_cmds = build_user_commands(data, f"/{data['department']}", groups)
+    if journal is not None:
+        forget_deleted_accounts([data["email"]], journal)
+    with MetricsCollector() as metrics:
+        results = run_user_commands([(data["email"], create_cmd, update_cmds + group_cmds)], journal)[0]
+    timings = metrics.summary(data["email"])
+    log.info(f"Timings for {data['email']}: {format_timings(timings)}")
+    return results, timings
+
+# Groups a user is currently a member of, read with a single GAM call
+def fetch_user_groups(email):
+    result = run_gam_command(["print", "groups", "member", email])
+    if not result.ok:
+        raise RuntimeError(result.stderr.strip() or f"could not read the groups of {email}")
+    groups = set()
+    for row in csv.reader(io.StringIO(result.stdout)):
+        # The first column holds the group email; skip empty lines and the header
+        if row and row[0].strip() and row[0].strip() != "email":
+            groups.add(row[0].strip())
+    return sorted(groups)
+
+# Splits the difference between a user's current and desired groups into (to add, to remove).
+# Group emails are compared case-insensitively; nothing is removed unless remove is set.
+def membership_changes(current, desired, remove=False):
+    current_by_key = {group.lower(): group for group in current}
+    desired_by_key = {group.lower(): group for group in desired}
+    to_add = sorted(desired_by_key[key] for key in desired_by_key.keys() - current_by_key.keys())
+    to_remove = sorted(current_by_key[key] for key in current_by_key.keys() - desired_by_key.keys()) if remove else []
+    return to_add, to_remove
+
+def membership_commands(email, to_add, to_remove):
+    return ([["update", "group", group, "add", "member", email] for group in to_add]
+            + [["update", "group", group, "delete", "member", email] for group in to_remove])
+
+# Brings an existing user's memberships in line with the groups computed for them: one GAM call to read
+# the current memberships, then only the missing additions (and removals when asked for).
+# With dry_run the changes are only computed. Returns a dict with the diff and the GamResults.
+def sync_user_groups(email, groups, remove=False, dry_run=False):
+    current = fetch_user_groups(email)
+    to_add, to_remove = membership_changes(current, groups, remove)
+    results = []
+    if not dry_run:
+        batch = GamBatch()
+        for cmd in membership_commands(email, to_add, to_remove):
+            batch.add(cmd)
+        results = batch.run()
+    return {"email": email, "current": current, "to_add": to_add, "to_remove": to_remove, "results": results}
+
+# Fields read from a reorg CSV: the user's email and their new department, location and job title.
+# Empty cells keep the current value.
+REASSIGN_FIELDS = ["email", "department", "location", "job_title"]
+
+# Current department, location, job title and org unit of users, read with a single `gam print users` call.
+# Pass one email to query just that user, or None to list the whole domain. Returns {email lower: fields}.
+def fetch_user_org_fields(email=None):
+    command = ["print", "users"]
+    if email:
+        command += ["query", f"email:{email}"]
+    result = run_gam_command(command + ["fields", "primaryemail,organizations,ou"])
+    if not result.ok:
+        raise RuntimeError(result.stderr.strip() or "could not list users")
+    
+    users = {}
+    for row in csv.DictReader(io.StringIO(result.stdout)):
+        row = {key.lower(): (value or "").strip() for key, value in row.items() if key}
+        if not row.get("primaryemail"):
+            continue
+        users[row["primaryemail"].lower()] = {
+            "department": row.get("organizations.0.department", ""),
+            "location": row.get("organizations.0.location", ""),
+            "job_title": row.get("organizations.0.title", ""),
+            "org_unit": row.get("orgunitpath", ""),
+        }
+    return users
+
+# Works out what changes for a user moving from their current org fields to new ones: the groups
+# computed for the old and new fields, the difference between them, and the GAM commands to apply it.
+# Only groups the rules assign are touched; memberships added by hand stay as they are.
+def plan_reassignment(email, current, new, resolver):
+    target = {field: new.get(field) or current[field] for field in ("department", "location", "job_title")}
+    old_groups = resolver.resolve(current["department"], current["location"], current["job_title"])
+    new_groups = resolver.resolve(target["department"], target["location"], target["job_title"])
+    to_add, to_remove = membership_changes(old_groups, new_groups, remove=True)
+    
+    commands = []
+    if any(target[field] != current[field] for field in target):
+        cmd = ["update", "user", email, "organization"]
+        if target["job_title"]: cmd += ["title", target["job_title"]]
+        if target["department"]: cmd += ["department", target["department"]]
+        if target["location"]: cmd += ["location", target["location"]]
+        commands.append(cmd)
+    if target["department"] and normalize_text(target["department"]) != normalize_text(current["department"]):
+        commands.append(["update", "user", email, "org", f"/{target['department']}"])
+    commands += membership_commands(email, to_add, to_remove)
+    return {"email": email, "current": current, "target": target, "to_add": to_add, "to_remove": to_remove, "commands": commands}
+
+# Applies department/location/title changes for many users after a reorg. The current org fields of
+# everyone are read with one GAM call, then only the group differences and profile updates run,
+# BULK_CHUNK_SIZE users per GAM batch. progress is called with (users done, total) after every chunk.
+def reassign_users(changes, group_index, progress=None, dry_run=False):
+    if len(changes) == 1:
+        current_fields = fetch_user_org_fields(changes[0]["email"])
+    else:
+        current_fields = fetch_user_org_fields()
+    
+    resolver = GroupResolver(group_index)
+    results = []
+    plans = []
+    for change in changes:
+        current = current_fields.get(change["email"].lower())
+        if current is None:
+            results.append({"email": change["email"], "status": "not found", "to_add": [], "to_remove": [], "errors": ["user does not exist"]})
+            continue
+        plan = plan_reassignment(change["email"], current, change, resolver)
+        plans.append(plan)
+        results.append(plan)
+    
+    if dry_run:
+        for plan in plans:
+            plan["status"] = "planned" if plan["commands"] else "unchanged"
+            plan["errors"] = []
+        return results
+    
+    for chunk_start in range(0, len(plans), BULK_CHUNK_SIZE):
+        chunk = plans[chunk_start:chunk_start + BULK_CHUNK_SIZE]
+        batch = GamBatch()
+        for plan in chunk:
+            for cmd in plan["commands"]:
+                batch.add(cmd)
+        command_results = iter(batch.run())
+        for plan in chunk:
+            user_results = [next(command_results) for _ in plan["commands"]]
+            failed = [result for result in user_results if not is_effectively_done(result)]
+            plan["errors"] = [describe_failure(result) for result in failed]
+            if not user_results:
+                plan["status"] = "unchanged"
+            elif failed:
+                plan["status"] = "failed" if len(failed) == len(user_results) else "partial"
+            else:
+                plan["status"] = "changed"
+        if progress:
+            progress(min(chunk_start + len(chunk), len(plans)), len(plans))
+    return results
+
+def read_reassign_csv(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return [{field: (raw.get(field) or "").strip() for field in REASSIGN_FIELDS} for raw in csv.DictReader(f)]
+
+# Returns the group list for headless use: the cache while it is fresh, otherwise a new GAM listing.
+# An expired cache is still used when GAM cannot be reached.
+def load_groups(refresh=False, full=False):
+    groups, fetched_at = load_group_cache()
+    if groups is not None and not refresh and not full and not is_group_cache_stale(fetched_at):
+        return groups
+    try:
+        return sync_group_directory(full=full).groups
+    except (OSError, RuntimeError) as e:
+        if groups is None:
+            raise
+        log.warning(f"Could not refresh groups, using the cached list: {e}")
+        return groups
+
+# Reads a bulk import CSV into dicts shaped like UserCreatorApp.collect_input()
+def read_users_csv(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        rows = []
+        for raw in reader:
+            data = {field: (raw.get(field) or "").strip() for field in USER_FIELDS}
+            data["change_password"] = "on" if data["change_password"].lower() in ("on", "true", "yes", "1") else "off"
+            rows.append(data)
+    return rows
+
+# Returns the problems with one user's data, an empty list when it can be provisioned
+def validate_user_data(data):
+    errors = [f"missing {field}" for field in REQUIRED_FIELDS if not data[field]]
+    if data["email"] and "@" not in data["email"]:
+        errors.append(f"invalid email {data['email']}")
+    if data["department"] and data["department"] not in DEPARTMENTS:
+        errors.append(f"unknown department {data['department']}")
+    return errors
+
+# Validates every row up front, returning {row number: [errors]} for the rows that cannot be provisioned
+def validate_bulk_rows(rows):
+    problems = {}
+    seen_emails = {}
+    for row_number, data in enumerate(rows, start=1):
+        errors = validate_user_data(data)
+        email = data["email"].lower()
+        if email and email in seen_emails:
+            errors.append(f"duplicate of row {seen_emails[email]}")
+        seen_emails.setdefault(email, row_number)
+        if errors:
+            problems[row_number] = errors
+    return problems
+
+# Provisions many users, BULK_CHUNK_SIZE at a time, each chunk through a single GAM batch.
+# progress is called with (users done, total) after every chunk. Returns one result dict per row,
+# including the time each user spent in every phase. With a journal, a rerun of the same file
+# only repeats the steps that did not complete.
+def provision_users(rows, group_index, progress=None, journal=None):
+    # Compute every user's groups before any GAM work starts, all against the same group list
+    start = time.perf_counter()
+    all_user_groups = determine_groups_for_users(rows, group_index)
+    resolution_share = (time.perf_counter() - start) / max(len(rows), 1)
+    
+    plans = []
+    for data, groups in zip(rows, all_user_groups):
+        create_cmd, update_cmds, group_cmds = build_user_commands(data, f"/{data['department']}", groups)
+        plans.append((data, groups, (data["email"], create_cmd, update_cmds + group_cmds)))
+    if journal is not None:
+        forget_deleted_accounts([data["email"] for data in rows], journal)
+    
+    # With `gam batch` the users go in chunks, one batch file each, to spread GAM's startup time.
+    # When commands run on their own, all users go through the pipeline at once and are reported
+    # as each one finishes.
+    chunk_size = len(plans) if gam_commands_run_individually() else BULK_CHUNK_SIZE
+    results = [None] * len(plans)
+    finished = 0
+    for chunk_start in range(0, len(plans), max(chunk_size, 1)):
+        chunk = plans[chunk_start:chunk_start + chunk_size]
+        
+        with MetricsCollector() as metrics:
+            def user_finished(n, user_results):
+                nonlocal finished
+                data, groups, _ = chunk[n]
+                timings = metrics.summary(data["email"])
+                # Resolution runs once for the whole file, each user is charged an equal share
+                timings["group_resolution"] = {"count": 1, "seconds": round(resolution_share, 6)}
+                results[chunk_start + n] = {
+                    "email": data["email"],
+                    "status": provisioning_status(user_results),
+                    "groups": groups,
+                    "errors": [describe_failure(result) for result in user_results if not is_effectively_done(result)],
+                    "timings": timings,
+                }
+                finished += 1
+                if progress:
+                    progress(finished, len(plans))
+            
+            run_user_commands([commands for _, _, commands in chunk], journal, user_finished)
+    return results
+
+# Writes one line per provisioned user next to the input file
+def write_bulk_results(path, results):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["row", "email", "status", "groups", "errors", "timings"])
+        for row_number, result in enumerate(results, start=1):
+            writer.writerow([row_number, result["email"], result["status"], ";".join(result["groups"]), " | ".join(result["errors"]), format_timings(result["timings"])])
+
+def open_journal(args):
+    return None if args.no_journal else ProvisioningJournal()
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Create Google Workspace users and add them to the right groups through GAM.")
+    parser.add_argument("--no-journal", action="store_true", help="do not skip steps that an earlier run already completed")
+    parser.add_argument("--metrics", metavar="FILE", help="append a JSON line with the timing of every GAM call and group lookup to FILE")
+    parser.add_argument("--profile", action="store_true", help="profile startup, previews and user creation and write a report under GWS_PROFILE_DIR")
+    subparsers = parser.add_subparsers(dest="command")
+    
+    preview = subparsers.add_parser("preview", help="print the groups a user would be added to")
+    preview.add_argument("--department", default="", help="department name, e.g. HR")
+    preview.add_argument("--location", default="")
+    preview.add_argument("--job-title", default="")
+    preview.add_argument("--refresh-groups", action="store_true", help="fetch a new group list from GAM instead of using the cache")
+    
+    create = subparsers.add_parser("create", help="create one user and add them to their groups")
+    create.add_argument("--given-name", required=True)
+    create.add_argument("--family-name", required=True)
+    create.add_argument("--email", required=True)
+    create.add_argument("--department", required=True, choices=DEPARTMENTS)
+    create.add_argument("--password", default="", help="generated and printed when omitted")
+    create.add_argument("--job-title", default="")
+    create.add_argument("--manager-email", default="")
+    create.add_argument("--location", default="")
+    create.add_argument("--phone", default="")
+    create.add_argument("--change-password", action="store_true", help="user must change password at next login")
+    create.add_argument("--refresh-groups", action="store_true", help="fetch a new group list from GAM instead of using the cache")
+    create.add_argument("--dry-run", action="store_true", help="print the GAM commands without running them")
+    
+    sync = subparsers.add_parser("sync", help="add an existing user to the groups they are missing")
+    sync.add_argument("--email", required=True)
+    sync.add_argument("--department", required=True, choices=DEPARTMENTS)
+    sync.add_argument("--location", default="")
+    sync.add_argument("--job-title", default="")
+    sync.add_argument("--remove", action="store_true", help="also remove the user from groups that are not computed for them")
+    sync.add_argument("--refresh-groups", action="store_true", help="fetch a new group list from GAM instead of using the cache")
+    sync.add_argument("--dry-run", action="store_true", help="print the changes without making them")
+    
+    reassign = subparsers.add_parser("reassign", help="move users to a new department, location or job title and update their groups")
+    target = reassign.add_mutually_exclusive_group(required=True)
+    target.add_argument("--email", help="the user to move")
+    target.add_argument("--csv", dest="csv_file", help=f"CSV with the columns {', '.join(REASSIGN_FIELDS)}; empty cells keep the current value")
+    reassign.add_argument("--department", default="", choices=[""] + DEPARTMENTS)
+    reassign.add_argument("--location", default="")
+    reassign.add_argument("--job-title", default="")
+    reassign.add_argument("--results", help="where to write the results CSV when --csv is used (default: <csv>_results.csv)")
+    reassign.add_argument("--refresh-groups", action="store_true", help="fetch a new group list from GAM instead of using the cache")
+    reassign.add_argument("--dry-run", action="store_true", help="print the changes without making them")
+    
+    bulk = subparsers.add_parser("bulk", help="create every user in a CSV file")
+    bulk.add_argument("csv_file", help=f"CSV with the columns {', '.join(USER_FIELDS)}")
+    bulk.add_argument("--results", help="where to write the results CSV (default: <csv_file>_results.csv)")
+    bulk.add_argument("--refresh-groups", action="store_true", help="fetch a new group list from GAM instead of using the cache")
+    bulk.add_argument("--dry-run", action="store_true", help="validate the file and print each user's groups without running GAM")
+    
+    refresh = subparsers.add_parser("refresh-groups", help="fetch the group changes from GAM and update the local cache")
+    refresh.add_argument("--full", action="store_true", help="list every group again instead of only reading what changed")
+    subparsers.add_parser("gui", help="open the window (the default)")
+    return parser
+
+def cli_refresh_groups(args, group_index):
+    print(f"Cached {len(group_index)} groups in {GROUP_CACHE_FILE}")
+    return 0
+
+def cli_preview(args, group_index):
+    groups = determine_groups_to_add(args.department, args.location, args.job_title, group_index)
+    print("\n".join(groups) if groups else "No groups found.")
+    return 0
+
+def cli_create(args, group_index):
+    data = {field: (getattr(args, field, "") or "").strip() for field in USER_FIELDS if field != "change_password"}
+    data["change_password"] = "on" if args.change_password else "off"
+    if not data["password"]:
+        data["password"] = generate_random_password()
+        print(f"Generated password: {data['password']}")
+    errors = validate_user_data(data)
+    if errors:
+        print(f"Invalid user: {', '.join(errors)}", file=sys.stderr)
+        return 2
+    
+    groups = determine_groups_to_add(data["department"], data["location"], data["job_title"], group_index)
+    if args.dry_run:
+        for command in build_user_batch(data, groups).commands:
+            print(format_command(["gam"] + command))
+        return 0
+    
+    results, _ = provision_user(data, groups, open_journal(args))
+    failed = [result for result in results if not is_effectively_done(result)]
+    for result in failed:
+        print(f"Failed: {describe_failure(result)}", file=sys.stderr)
+    if failed:
+        return 1
+    if not results:
+        print(f"User {data['email']} was already fully provisioned by an earlier run.")
+        return 0
+    print(f"User {data['email']} created and added to {len(groups)} groups.")
+    return 0
+
+def cli_sync(args, group_index):
+    groups = determine_groups_to_add(args.department, args.location, args.job_title, group_index)
+    try:
+        sync = sync_user_groups(args.email, groups, remove=args.remove, dry_run=args.dry_run)
+    except (OSError, RuntimeError) as e:
+        print(f"Failed to read the groups of {args.email}: {e}", file=sys.stderr)
+        return 1
+    
+    for group in sync["to_add"]:
+        print(f"add    {group}")
+    for group in sync["to_remove"]:
+        print(f"remove {group}")
+    failed = [result for result in sync["results"] if not is_effectively_done(result)]
+    for result in failed:
+        print(f"Failed: {describe_failure(result)}", file=sys.stderr)
+    if not sync["to_add"] and not sync["to_remove"]:
+        print(f"{args.email} is already in all {len(groups)} groups.")
+    return 1 if failed else 0
+
+def cli_bulk(args, group_index):
+    try:
+        rows = read_users_csv(args.csv_file)
+    except (OSError, csv.Error, UnicodeDecodeError) as e:
+        print(f"Could not read {args.csv_file}: {e}", file=sys.stderr)
+        return 2
+    problems = validate_bulk_rows(rows)
+    if problems:
+        for row_number, errors in sorted(problems.items()):
+            print(f"Row {row_number}: {', '.join(errors)}", file=sys.stderr)
+        print(f"{len(problems)} of {len(rows)} rows are invalid, nothing was created.", file=sys.stderr)
+        return 2
+    
+    if args.dry_run:
+        for data, groups in zip(rows, determine_groups_for_users(rows, group_index)):
+            print(f"{data['email']}: {', '.join(groups) if groups else 'no groups'}")
+        return 0
+    
+    results = provision_users(rows, group_index, lambda done, total: log.info(f"Provisioned {done}/{total} users"), open_journal(args))
+    results_path = args.results or os.path.splitext(args.csv_file)[0] + "_results.csv"
+    write_bulk_results(results_path, results)
+    complete = sum(1 for result in results if result["status"] in ("created", "unchanged"))
+    print(f"{complete} of {len(results)} users fully provisioned. Details written to {results_path}")
+    return 0 if complete == len(results) else 1
+
+def cli_reassign(args, group_index):
+    if args.csv_file:
+        try:
+            changes = read_reassign_csv(args.csv_file)
+        except (OSError, csv.Error, UnicodeDecodeError) as e:
+            print(f"Could not read {args.csv_file}: {e}", file=sys.stderr)
+            return 2
+        invalid = [f"Row {n}: unknown department {change['department']}" for n, change in enumerate(changes, start=1)
+                   if change["department"] and change["department"] not in DEPARTMENTS]
+        invalid += [f"Row {n}: missing email" for n, change in enumerate(changes, start=1) if not change["email"]]
+        if invalid:
+            print("\n".join(invalid), file=sys.stderr)
+            return 2
+    else:
+        changes = [{"email": args.email, "department": args.department, "location": args.location, "job_title": args.job_title}]
+    
+    try:
+        results = reassign_users(changes, group_index, lambda done, total: log.info(f"Reassigned {done}/{total} users"), args.dry_run)
+    except (OSError, RuntimeError) as e:
+        print(f"Failed to read the current users: {e}", file=sys.stderr)
+        return 1
+    
+    for result in results:
+        print(f"{result['email']}: {result['status']}"
+              + "".join(f"\n  add    {group}" for group in result["to_add"])
+              + "".join(f"\n  remove {group}" for group in result["to_remove"])
+              + "".join(f"\n  error  {error}" for error in result["errors"]))
+    
+    if args.csv_file and not args.dry_run:
+        results_path = args.results or os.path.splitext(args.csv_file)[0] + "_results.csv"
+        with open(results_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["email", "status", "added", "removed", "errors"])
+            for result in results:
+                writer.writerow([result["email"], result["status"], ";".join(result["to_add"]), ";".join(result["to_remove"]), " | ".join(result["errors"])])
+        print(f"Details written to {results_path}")
+    return 0 if all(result["status"] in ("changed", "unchanged", "planned") for result in results) else 1
+
+CLI_COMMANDS = {
+    "refresh-groups": cli_refresh_groups,
+    "preview": cli_preview,
+    "create": cli_create,
+    "sync": cli_sync,
+    "reassign": cli_reassign,
+    "bulk": cli_bulk,
+}
+
+def main(argv=None):
+    global METRICS_FILE, profiler
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.metrics:
+        METRICS_FILE = args.metrics
+    if not args.profile:
+        return run_command(args)
+    
+    # The startup phase ends once groups are loaded, or in the window once it first goes idle.
+    # The run is labelled with the subcommand only: the full command line can hold a password.
+    import gws_profile
+    profiler = gws_profile
+    profiler.start_profiling(PROFILE_DIR, args.command or "gui")
+    begin_phase("startup")
+    try:
+        return run_command(args)
+    finally:
+        log.info(f"Profile written to {profiler.stop_profiling()}")
+
+def run_command(args):
+    # tkinter is only imported when the window is actually opened
+    if args.command in (None, "gui"):
+        with profile_phase("import window"):
+            from gws_user_creator_gui import run_gui
+        run_gui()
+        return 0
+    
+    # Every other command resolves groups, so a rules file that cannot be loaded stops it before any GAM call
+    try:
+        current_group_rules()
+    except RuntimeError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    try:
+        with profile_phase("load groups"):
+            group_index = GroupIndex(load_groups(refresh=args.command == "refresh-groups" or args.refresh_groups, full=getattr(args, "full", False)))
+    except (OSError, RuntimeError) as e:
+        print(f"Failed to fetch groups: {e}", file=sys.stderr)
+        return 1
+    end_phase("startup")
+    with profile_phase(args.command):
+        return CLI_COMMANDS[args.command](args, group_index)
+
+if __name__ == "__main__":
+    sys.exit(main())
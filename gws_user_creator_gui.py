@@ -0,0 +1,611 @@
+"""Tkinter window for the Google Workspace user creator. The logic lives in gws_user_creator."""
+import tkinter as tk
+from tkinter import ttk, messagebox, filedialog
+import os
+import csv
+import queue
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from gws_user_creator import (
+    DEPARTMENTS, GroupIndex, GroupResolver, log, generate_random_password, current_group_rules, fold_text,
+    sync_group_directory, load_group_cache, is_group_cache_stale,
+    ProvisioningJournal, provision_user, sync_user_groups, membership_commands, GamBatch, is_effectively_done, describe_failure, read_users_csv, validate_bulk_rows, provision_users, write_bulk_results,
+    begin_phase, end_phase, profile_phase,
+)
+
+# Pause in typing, in milliseconds, before location suggestions are looked up
+LOCATION_SUGGESTION_DELAY_MS = 150
+
+# Pause in typing, in milliseconds, before the group preview is brought up to date, and how many
+# resolved Department/Location/Job Title combinations the preview keeps around
+GROUP_PREVIEW_DELAY_MS = 250
+GROUP_PREVIEW_CACHE_SIZE = 256
+
+# Forwards log records to the UI queue so the Tk main loop can show them
+class QueueLogHandler(logging.Handler):
+    def __init__(self, ui_queue):
+        super().__init__()
+        self.ui_queue = ui_queue
+
+    def emit(self, record):
+        self.ui_queue.put(("log", record.levelno, self.format(record)))
+
+class UserCreatorApp:
+    def __init__(self, root):
+        self.root = root
+        root.title("Google Workspace User Creator Script: Author: Arber Celaj")
+        self.root.geometry("640x710")
+        self.root.resizable(False, False)
+        
+        # GAM work runs on these threads; results come back through ui_queue, which is polled from the Tk main loop
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.ui_queue = queue.Queue()
+        self.log_handler = QueueLogHandler(self.ui_queue)
+        log.addHandler(self.log_handler)
+        self.refreshing_groups = False
+        self.provisioning = False
+        
+        # Create all the form fields for user input
+        self.entries = {}
+        for i, (label_text, var_name) in enumerate([
+            ("Given Name", "given_name"),
+            ("Family Name", "family_name"),
+            ("Primary Email", "email"),
+            ("Job Title", "job_title"),
+            ("Manager Email", "manager_email"),
+            ("Location", "location"),
+            ("Phone Number", "phone"),
+        ]):
+            tk.Label(self.root, text=label_text).grid(row=i, column=0, sticky="e", padx=5, pady=2)
+            if var_name == "location":
+                # Editable drop-down that lists known locations matching what has been typed so far
+                entry = ttk.Combobox(self.root, width=38)
+                entry.grid(row=i, column=1, sticky="w")
+                entry.bind("<KeyRelease>", self.schedule_location_suggestions)
+                entry.bind("<<ComboboxSelected>>", self.schedule_location_suggestions)
+            else:
+                entry = tk.Entry(self.root, width=40)
+                entry.grid(row=i, column=1, columnspan=3, sticky="w")
+            # The group preview follows the fields the groups are resolved from
+            if var_name in ("job_title", "location"):
+                entry.bind("<KeyRelease>", self.schedule_group_preview, add="+")
+            if var_name == "location":
+                entry.bind("<<ComboboxSelected>>", self.schedule_group_preview, add="+")
+            self.entries[var_name] = entry
+        
+        # Shows the location the groups will be matched against when it differs from what was typed
+        self.location_hint_var = tk.StringVar()
+        tk.Label(self.root, textvariable=self.location_hint_var, fg="grey").grid(row=5, column=2, columnspan=2, sticky="w", padx=5)
+        self.location_after_id = None
+        
+        tk.Label(self.root, text="Department").grid(row=7, column=0, sticky="e", padx=5, pady=2)
+        self.department_var = tk.StringVar()
+        dept_menu = ttk.Combobox(self.root, textvariable=self.department_var, values=DEPARTMENTS, state="readonly", width=38)
+        dept_menu.grid(row=7, column=1, columnspan=3, sticky="w")
+        dept_menu.bind("<<ComboboxSelected>>", self.schedule_group_preview)
+        
+        tk.Label(self.root, text="Password").grid(row=8, column=0, sticky="e", padx=5, pady=2)
+        self.password_entry = tk.Entry(self.root, width=40, show="•")
+        self.password_entry.grid(row=8, column=1, sticky="w")
+        
+        self.show_pw_var = tk.BooleanVar()
+        tk.Checkbutton(self.root, text="Show Password", variable=self.show_pw_var, command=self.toggle_password_visibility).grid(row=8, column=2, sticky="w")
+        
+        tk.Button(self.root, text="Generate Password", command=self.generate_password).grid(row=8, column=3, padx=5)
+        
+        self.change_pw_var = tk.BooleanVar()
+        tk.Checkbutton(self.root, text="User must change password at next login", variable=self.change_pw_var).grid(row=9, column=1, columnspan=3, sticky="w", pady=2)
+        
+        # Text area for previewing groups before creation
+        tk.Label(self.root, text="Groups to be added:").grid(row=10, column=0, sticky="nw", padx=5)
+        self.groups_text = tk.Text(self.root, height=8, width=60, state="disabled")
+        self.groups_text.grid(row=10, column=1, columnspan=3, pady=5)
+        self.preview_after_id = None
+        self.previewed_groups = None
+        
+        self.refresh_button = tk.Button(self.root, text="Refresh Groups", command=self.refresh_groups)
+        self.refresh_button.grid(row=11, column=0, sticky="w", padx=5, pady=8)
+        tk.Button(self.root, text="Preview Groups", command=self.preview_groups).grid(row=11, column=1, sticky="e", padx=2, pady=8)
+        tk.Button(self.root, text="Clear Fields", command=self.clear_fields).grid(row=11, column=2, sticky="e", padx=2)
+        self.create_button = tk.Button(self.root, text="Create User", command=self.create_user, bg="light grey")
+        self.create_button.grid(row=11, column=3, sticky="e", padx=2)
+        
+        self.bulk_button = tk.Button(self.root, text="Bulk Import CSV", command=self.bulk_import)
+        self.bulk_button.grid(row=12, column=0, sticky="w", padx=5)
+        self.sync_button = tk.Button(self.root, text="Sync Groups", command=self.sync_groups)
+        self.sync_button.grid(row=12, column=1, sticky="e", padx=2)
+        # A full listing is the only refresh that picks up renamed groups
+        self.full_refresh_button = tk.Button(self.root, text="Full Group Refresh", command=lambda: self.refresh_groups(full=True))
+        self.full_refresh_button.grid(row=12, column=2, sticky="e", padx=2)
+        
+        # Progress and log pane showing each GAM command as it finishes
+        self.status_var = tk.StringVar(value="Ready")
+        tk.Label(self.root, textvariable=self.status_var, anchor="w").grid(row=13, column=0, columnspan=3, sticky="w", padx=5)
+        self.progress_bar = ttk.Progressbar(self.root, length=150, mode="determinate")
+        self.progress_bar.grid(row=13, column=3, sticky="e", padx=2)
+        
+        log_frame = tk.Frame(self.root)
+        log_frame.grid(row=14, column=0, columnspan=4, sticky="we", padx=5, pady=5)
+        self.log_text = tk.Text(log_frame, height=9, width=86, state="disabled", font=("TkFixedFont", 8))
+        log_scroll = tk.Scrollbar(log_frame, command=self.log_text.yview)
+        self.log_text.config(yscrollcommand=log_scroll.set)
+        self.log_text.tag_config("error", foreground="red")
+        self.log_text.tag_config("warning", foreground="dark orange")
+        self.log_text.pack(side="left", fill="both", expand=True)
+        log_scroll.pack(side="right", fill="y")
+        
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        self.root.after(100, self.process_ui_queue)
+        
+        # Load all groups at startup, from the local cache when one exists. groups_fetched_at is the
+        # fetched_at of the cached list the index was built from, None when it is not from the cache.
+        self.groups_fetched_at = None
+        self.set_groups([])
+        with profile_phase("load groups"):
+            self.fetch_all_groups()
+
+    def fetch_all_groups(self):
+        """Load group emails from the local cache, falling back to GAM when there is no cache."""
+        groups, fetched_at = load_group_cache()
+        if groups is not None:
+            self.set_groups(groups)
+            self.groups_fetched_at = fetched_at
+            # Serve the cached list right away and refresh it in the background once it has expired
+            if is_group_cache_stale(fetched_at):
+                self.refresh_groups(background=True)
+            return
+        
+        self.refresh_groups(first_load=True)
+
+    # Only the compact index is kept, not the list of group emails it was built from
+    def set_groups(self, groups):
+        self.set_group_index(GroupIndex(groups))
+
+    # Resolved groups are only valid for the index they were resolved against, so the preview's
+    # resolver is replaced with it and the preview redone
+    def set_group_index(self, group_index):
+        self.group_index = group_index
+        self.resolver = GroupResolver(group_index, maxsize=GROUP_PREVIEW_CACHE_SIZE)
+        self.schedule_group_preview()
+
+    # Runs func on the background executor and calls on_done(result, error) from the Tk main loop when it finishes
+    def run_in_background(self, func, on_done):
+        def worker():
+            try:
+                self.ui_queue.put(("done", on_done, func(), None))
+            except Exception as e:
+                log.exception("Background task failed")
+                self.ui_queue.put(("done", on_done, None, e))
+        self.executor.submit(worker)
+
+    # Applies everything the worker threads queued up; widgets must only be touched from this thread
+    def process_ui_queue(self):
+        try:
+            while True:
+                item = self.ui_queue.get_nowait()
+                if item[0] == "log":
+                    self.append_log(item[1], item[2])
+                elif item[0] == "progress":
+                    self.set_progress(item[1], item[2], item[3])
+                elif item[0] == "status":
+                    self.status_var.set(item[1])
+                elif item[0] == "done":
+                    item[1](item[2], item[3])
+        except queue.Empty:
+            pass
+        self.root.after(100, self.process_ui_queue)
+
+    def append_log(self, level, message):
+        tag = "error" if level >= logging.ERROR else "warning" if level >= logging.WARNING else ""
+        self.log_text.config(state="normal")
+        self.log_text.insert(tk.END, message + "\n", tag)
+        self.log_text.see(tk.END)
+        self.log_text.config(state="disabled")
+
+    # Shows a status line and a progress bar; total=None means the amount of work is unknown
+    def set_progress(self, status, done=0, total=None):
+        self.status_var.set(status)
+        if total is None:
+            self.progress_bar.config(mode="indeterminate")
+            self.progress_bar.start(15)
+        else:
+            self.progress_bar.stop()
+            self.progress_bar.config(mode="determinate", maximum=max(total, 1), value=done)
+
+    # Runs a provisioning function with a journal, so steps completed by an earlier attempt are skipped
+    @staticmethod
+    def with_journal(provision, *args):
+        journal = ProvisioningJournal()
+        try:
+            return provision(*args, journal=journal)
+        finally:
+            journal.close()
+
+    # Provisioning jobs run one at a time
+    def set_provisioning(self, busy):
+        self.provisioning = busy
+        state = "disabled" if busy else "normal"
+        self.create_button.config(state=state)
+        self.bulk_button.config(state=state)
+        self.sync_button.config(state=state)
+
+    # Brings the group list up to date from GAM in the background so the window stays usable. Usually only
+    # the groups created or deleted since the last refresh are read, see sync_group_directory(); with
+    # full set the whole directory is listed.
+    def refresh_groups(self, background=False, first_load=False, full=False):
+        if self.refreshing_groups:
+            return
+        
+        self.refreshing_groups = True
+        self.refresh_button.config(state="disabled")
+        self.full_refresh_button.config(state="disabled")
+        begin_phase("refresh groups")
+        if not background:
+            self.set_progress("Loading groups from Google Workspace...")
+        # The running count is only shown when the user is waiting for the list
+        progress = None if background else lambda count: self.ui_queue.put(("status", f"{count} groups loaded..."))
+        self.run_in_background(lambda: sync_group_directory(full=full, progress=progress), lambda sync, error: self.finish_refresh_groups(sync, error, background, first_load))
+
+    def finish_refresh_groups(self, sync, error, background, first_load):
+        end_phase("refresh groups")
+        self.refreshing_groups = False
+        self.refresh_button.config(state="normal")
+        self.full_refresh_button.config(state="normal")
+        if not background:
+            self.set_progress(f"{len(self.group_index)} groups loaded", 0, 0)
+        
+        if error is not None:
+            if background:
+                log.warning(f"Background group refresh failed, keeping cached groups: {error}")
+            else:
+                messagebox.showerror("Error", f"Failed to fetch groups: {error}")
+            return
+        if not sync.groups:
+            if not background:
+                messagebox.showwarning("Warning", "No groups fetched from Google Workspace.")
+            return
+        
+        if sync.full:
+            self.set_groups(sync.groups)
+            summary = f"Loaded {len(sync.groups)} groups from Google Workspace."
+        elif sync.previous_fetched_at != self.groups_fetched_at:
+            # The cache was brought up to date elsewhere since this window loaded it (e.g. by
+            # `refresh-groups` on the command line), so the changes do not apply to the index
+            self.set_groups(sync.groups)
+            summary = f"{len(sync.groups)} groups: the group list was updated since it was loaded."
+        else:
+            # Only the changed groups are merged into the index; the rest of it is reused
+            self.set_group_index(self.group_index.with_changes(sync.added, sync.removed))
+            summary = f"{len(sync.groups)} groups: {len(sync.added)} added and {len(sync.removed)} removed since the last refresh."
+        self.groups_fetched_at = sync.fetched_at
+        log.info(summary)
+        if not background:
+            self.set_progress(f"{len(sync.groups)} groups loaded", 0, 0)
+            if not first_load:
+                messagebox.showinfo("Groups Refreshed", summary)
+
+    def close(self):
+        log.removeHandler(self.log_handler)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.root.destroy()
+
+    def toggle_password_visibility(self):
+        if self.show_pw_var.get():
+            self.password_entry.config(show="")
+        else:
+            self.password_entry.config(show="•")
+
+    def generate_password(self):
+        pwd = generate_random_password()
+        self.password_entry.delete(0, tk.END)
+        self.password_entry.insert(0, pwd)
+
+    # Shows which groups the user will be added to before creation
+    def preview_groups(self):
+        data = self.collect_input()
+        
+        if not data["email"] or not data["given_name"] or not data["family_name"]:
+            messagebox.showwarning("Missing Info", "At minimum, Given Name, Family Name, and Email are required.")
+            return
+        
+        if self.groups_still_loading():
+            return
+        
+        self.update_group_preview()
+
+    # Until the first group list has loaded the index is empty, so nothing may be resolved against it:
+    # says so and returns True while that is the case
+    def groups_still_loading(self):
+        if self.refreshing_groups and not self.group_index:
+            messagebox.showinfo("Loading Groups", "Groups are still being loaded from Google Workspace, please try again in a moment.")
+            return True
+        return False
+
+    # Resolves the groups for the form's Department, Location and Job Title. Results are remembered
+    # by self.resolver, so the preview and create_user resolve each combination only once. The live
+    # preview passes warn=False: the location hint already shows a location that matches nothing.
+    def resolve_form_groups(self, data, warn=True):
+        return self.resolver.resolve(data["department"], data["location"], data["job_title"], warn)
+
+    # The preview is only brought up to date once typing pauses for GROUP_PREVIEW_DELAY_MS
+    def schedule_group_preview(self, event=None):
+        if self.preview_after_id is not None:
+            self.root.after_cancel(self.preview_after_id)
+        self.preview_after_id = self.root.after(GROUP_PREVIEW_DELAY_MS, self.update_group_preview)
+
+    def update_group_preview(self):
+        if self.preview_after_id is not None:
+            self.root.after_cancel(self.preview_after_id)
+            self.preview_after_id = None
+        data = self.collect_input()
+        if not (data["department"] or data["location"] or data["job_title"]):
+            self.show_group_preview(None)
+            return
+        with profile_phase("preview"):
+            try:
+                groups = self.resolve_form_groups(data, warn=False)
+            except RuntimeError as e:
+                log.error(str(e))
+                return
+            self.show_group_preview(groups)
+
+    # groups=None empties the preview; the text is left alone when the groups have not changed
+    def show_group_preview(self, groups):
+        if groups == self.previewed_groups:
+            return
+        self.previewed_groups = groups
+        self.groups_text.config(state="normal")
+        self.groups_text.delete("1.0", tk.END)
+        if groups is not None:
+            self.groups_text.insert(tk.END, "\n".join(groups) if groups else "No groups found.")
+        self.groups_text.config(state="disabled")
+
+    # Suggestions are only looked up once typing pauses for LOCATION_SUGGESTION_DELAY_MS
+    def schedule_location_suggestions(self, event=None):
+        if self.location_after_id is not None:
+            self.root.after_cancel(self.location_after_id)
+        self.location_after_id = self.root.after(LOCATION_SUGGESTION_DELAY_MS, self.update_location_suggestions)
+
+    def update_location_suggestions(self):
+        self.location_after_id = None
+        location_entry = self.entries["location"]
+        typed = location_entry.get()
+        try:
+            rules = current_group_rules()
+        except RuntimeError as e:
+            log.error(str(e))
+            return
+        location_entry["values"] = rules.location_suggestions(typed, self.group_index)
+        resolved = rules.location_name(typed, self.group_index)
+        if fold_text(typed) and not resolved:
+            self.location_hint_var.set("→ no known location")
+        else:
+            self.location_hint_var.set(f"→ {resolved}" if resolved and resolved != fold_text(typed) else "")
+
+    def clear_fields(self):
+        for entry in self.entries.values():
+            entry.delete(0, tk.END)
+        self.entries["location"]["values"] = []
+        self.location_hint_var.set("")
+        
+        self.department_var.set("")
+        self.password_entry.delete(0, tk.END)
+        self.change_pw_var.set(False)
+        self.show_pw_var.set(False)
+        self.password_entry.config(show="•")
+        
+        if self.preview_after_id is not None:
+            self.root.after_cancel(self.preview_after_id)
+            self.preview_after_id = None
+        self.show_group_preview(None)
+
+    # Centralizes gathering of all form field values for consistency
+    def collect_input(self):
+        return {
+            "given_name": self.entries["given_name"].get().strip(),
+            "family_name": self.entries["family_name"].get().strip(),
+            "email": self.entries["email"].get().strip(),
+            "job_title": self.entries["job_title"].get().strip(),
+            "department": self.department_var.get().strip(),
+            "manager_email": self.entries["manager_email"].get().strip(),
+            "location": self.entries["location"].get().strip(),
+            "phone": self.entries["phone"].get().strip(),
+            "password": self.password_entry.get().strip(),
+            "change_password": "on" if self.change_pw_var.get() else "off",
+        }
+
+    # Creates the user in Google Workspace and adds them to groups
+    def create_user(self):
+        data = self.collect_input()
+
+        # Validate required fields
+        if not data["given_name"] or not data["family_name"] or not data["email"] or not data["department"] or not data["password"]:
+            messagebox.showerror("Missing Fields", "Please fill in all required fields.")
+            return
+        if self.groups_still_loading():
+            return
+        
+        # Set organizational unit path based on department
+        org_unit_path = f"/{data['department']}"
+        
+        # Determine which groups the user should be added to; usually already resolved for the preview
+        try:
+            groups = self.resolve_form_groups(data)
+        except RuntimeError as e:
+            messagebox.showerror("Group Rules", str(e))
+            return
+        
+        # A message box that shows up to verify if info provided is correct
+        confirm = messagebox.askyesno(
+            "Confirm User Creation",
+            f"Create user:\n\n"
+            f"Name: {data['given_name']} {data['family_name']}\n"
+            f"Email: {data['email']}\n"
+            f"Department: {data['department']}\n"
+            f"Org Unit: {org_unit_path}\n"
+            f"Groups to be added:\n- " + ("\n- ".join(groups) if groups else "None")
+        )
+        
+        if not confirm:
+            return
+        
+        begin_phase("create")
+        self.set_provisioning(True)
+        self.set_progress(f"Creating {data['email']}...")
+        self.run_in_background(lambda: self.with_journal(provision_user, data, groups), lambda outcome, error: self.finish_create_user(data["email"], outcome, error))
+
+    def finish_create_user(self, email, outcome, error):
+        end_phase("create")
+        self.set_provisioning(False)
+        if error is not None:
+            self.set_progress(f"Failed to create {email}", 0, 0)
+            messagebox.showerror("Error", f"Creating {email} failed: {error}")
+            return
+        
+        results, _ = outcome
+        if not results:
+            self.set_progress(f"{email} was already fully provisioned", 0, 0)
+            messagebox.showinfo("Nothing To Do", f"User {email} was already created and added to all groups by an earlier run.")
+            return
+        
+        failed = [result for result in results if not is_effectively_done(result)]
+        self.set_progress(f"{email}: {len(results) - len(failed)} of {len(results)} commands succeeded", len(results), len(results))
+        if failed:
+            messagebox.showerror(
+                "Completed With Errors",
+                f"{len(failed)} of {len(results)} GAM commands failed for {email}:\n\n"
+                + "\n".join(f"- {describe_failure(result)}" for result in failed)
+            )
+            return
+        
+        messagebox.showinfo("Success", f"User {email} created and added to groups.")
+
+    # Adds an existing user to the computed groups they are not in yet. Their current memberships are
+    # read with one GAM call first, and only the missing additions are made after confirmation.
+    def sync_groups(self):
+        data = self.collect_input()
+        if not data["email"] or not data["department"]:
+            messagebox.showwarning("Missing Info", "Primary Email and Department are required to sync groups.")
+            return
+        if self.groups_still_loading():
+            return
+        
+        try:
+            groups = self.resolve_form_groups(data)
+        except RuntimeError as e:
+            messagebox.showerror("Group Rules", str(e))
+            return
+        self.set_provisioning(True)
+        self.set_progress(f"Reading the groups of {data['email']}...")
+        self.run_in_background(lambda: sync_user_groups(data["email"], groups, dry_run=True), self.confirm_sync_groups)
+
+    def confirm_sync_groups(self, sync, error):
+        if error is not None:
+            self.set_provisioning(False)
+            self.set_progress("Sync failed", 0, 0)
+            messagebox.showerror("Error", f"Could not read the current groups: {error}")
+            return
+        
+        email = sync["email"]
+        if not sync["to_add"]:
+            self.set_provisioning(False)
+            self.set_progress(f"{email} is already in all computed groups", 0, 0)
+            messagebox.showinfo("Nothing To Do", f"{email} is already a member of every computed group.")
+            return
+        
+        confirm = messagebox.askyesno(
+            "Confirm Group Sync",
+            f"{email} is a member of {len(sync['current'])} groups.\n\n"
+            f"Groups to be added:\n- " + "\n- ".join(sync["to_add"])
+        )
+        if not confirm:
+            self.set_provisioning(False)
+            self.set_progress("Ready", 0, 0)
+            return
+        
+        batch = GamBatch()
+        for cmd in membership_commands(email, sync["to_add"], []):
+            batch.add(cmd)
+        self.set_progress(f"Adding {email} to {len(sync['to_add'])} groups...")
+        self.run_in_background(batch.run, lambda results, error: self.finish_sync_groups(email, results, error))
+
+    def finish_sync_groups(self, email, results, error):
+        self.set_provisioning(False)
+        if error is not None:
+            self.set_progress(f"Sync of {email} failed", 0, 0)
+            messagebox.showerror("Error", f"Syncing {email} failed: {error}")
+            return
+        
+        failed = [result for result in results if not is_effectively_done(result)]
+        self.set_progress(f"{email}: {len(results) - len(failed)} of {len(results)} groups added", len(results), len(results))
+        if failed:
+            messagebox.showerror("Completed With Errors", f"{len(failed)} of {len(results)} group additions failed for {email}:\n\n"
+                                 + "\n".join(f"- {describe_failure(result)}" for result in failed))
+            return
+        messagebox.showinfo("Success", f"{email} was added to {len(results)} groups.")
+
+    # Provisions every user in a CSV file after validating all rows
+    def bulk_import(self):
+        if self.groups_still_loading():
+            return
+        path = filedialog.askopenfilename(title="Select users CSV", filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not path:
+            return
+        
+        try:
+            rows = read_users_csv(path)
+        except (OSError, csv.Error, UnicodeDecodeError) as e:
+            messagebox.showerror("Error", f"Could not read {path}: {e}")
+            return
+        if not rows:
+            messagebox.showwarning("Bulk Import", "The CSV file has no users.")
+            return
+        
+        problems = validate_bulk_rows(rows)
+        if problems:
+            lines = [f"Row {row_number}: {', '.join(errors)}" for row_number, errors in sorted(problems.items())]
+            messagebox.showerror("Invalid Rows", f"{len(problems)} of {len(rows)} rows are invalid, nothing was created:\n\n" + "\n".join(lines[:20]) + ("\n..." if len(lines) > 20 else ""))
+            return
+        
+        if not messagebox.askyesno("Confirm Bulk Import", f"Create {len(rows)} users from {os.path.basename(path)}?"):
+            return
+        
+        def progress(done, total):
+            self.ui_queue.put(("progress", f"Provisioned {done}/{total} users", done, total))
+        
+        results_path = os.path.splitext(path)[0] + "_results.csv"
+        
+        def provision():
+            results = self.with_journal(provision_users, rows, self.group_index, progress)
+            write_bulk_results(results_path, results)
+            return results
+        
+        begin_phase("bulk import")
+        self.set_provisioning(True)
+        self.set_progress(f"Provisioned 0/{len(rows)} users", 0, len(rows))
+        self.run_in_background(provision, lambda results, error: self.finish_bulk_import(results_path, results, error))
+
+    def finish_bulk_import(self, results_path, results, error):
+        end_phase("bulk import")
+        self.set_provisioning(False)
+        if error is not None:
+            self.set_progress("Bulk import failed", 0, 0)
+            messagebox.showerror("Error", f"Bulk import failed: {error}")
+            return
+        
+        complete = sum(1 for result in results if result["status"] in ("created", "unchanged"))
+        messagebox.showinfo("Bulk Import Finished", f"{complete} of {len(results)} users fully provisioned.\nDetails written to {results_path}")
+
+def run_gui():
+    with profile_phase("create window"):
+        root = tk.Tk()
+    with profile_phase("build window"):
+        UserCreatorApp(root)
+    # Idle callbacks only run once the window has been drawn and can take input
+    root.after_idle(end_phase, "startup")
+    root.mainloop()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    run_gui()
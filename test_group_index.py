@@ -0,0 +1,130 @@
+"""GroupIndex lookups checked against plain linear scans over randomly generated group directories.
+
+Group resolution goes through the index and the rules file; the reference implementations below
+scan the whole list the way the code did before the index existed, following the token rules
+documented in group_rules.json. Run with `python -m pytest` or `python -m unittest`.
+"""
+import os
+import random
+import re
+import unittest
+
+import gws_user_creator as gws
+
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "group_rules.json")
+
+LOCATIONS = ["stockholm", "gothenburg", "malmo", "remote"]
+ROLE_WORDS = ["manager", "managers", "lead", "leads", "leadership", "director", "directors", "management"]
+# Words that contain department keys and other tokens as substrings, so substring and token
+# matching would disagree on them
+LOOKALIKES = ["chrome", "hrm", "salesforce", "legalese", "allcompany", "company", "all", "team", "project"]
+JOB_TITLES = ["", "Engineer", "Team Lead", "Manager", "HR Manager", "Director of Sales", "Leadership coach", "Lead Manager Director"]
+
+def generate_directory(rng, size):
+    vocabulary = list(gws.DEPARTMENT_KEYS.values()) + LOCATIONS + ROLE_WORDS + LOOKALIKES + ["announcements", "all-company", "office", "social"]
+    groups = {f"{location}-office@deytech.se" for location in LOCATIONS}
+    while len(groups) < size:
+        words = [rng.choice(vocabulary) for _ in range(rng.randint(1, 4))]
+        if rng.random() < 0.2:
+            words.append(f"{rng.randrange(1000):03d}")
+        name = "-".join(words)
+        if rng.random() < 0.1:
+            name = name.upper()
+        domain = "deytech.se" if rng.random() < 0.9 else rng.choice(["partner.com", "deytech.co.uk"])
+        groups.add(f"{name}@{domain}")
+    groups = sorted(groups)
+    rng.shuffle(groups)
+    return groups
+
+def local_tokens(group):
+    return group.lower().partition("@")[0].split("-")
+
+def has_tokens(group, tokens):
+    name_tokens = local_tokens(group)
+    return any(name_tokens[i:i + len(tokens)] == list(tokens) for i in range(len(name_tokens) - len(tokens) + 1))
+
+# Every group whose tokens include `tokens` in a row, minus the ones matching `exclude`, by scanning the list
+def linear_groups_with_tokens(groups, tokens, exclude=None):
+    return {group for group in groups if has_tokens(group, tokens) and not (exclude and re.search(exclude, "-".join(local_tokens(group))))}
+
+# The groups of group_rules.json for one user, by scanning the whole list for every rule
+def linear_determine_groups(department, location, job_title, groups):
+    dept_key = gws.DEPARTMENT_KEYS[department.lower()]
+    location = location.lower()
+    roles = [role for role in ("manager", "lead", "director") if re.search(rf"\b{role}\b", job_title.lower())]
+    result = linear_groups_with_tokens(groups, tuple(dept_key.split("-")), "manager|lead|director")
+    for role in roles:
+        result.update(group for group in (f"{dept_key}-{role}s@deytech.se", f"{dept_key}-{role}ship@deytech.se") if group in groups)
+    if location:
+        result |= linear_groups_with_tokens(groups, (location,), "management")
+        if roles and f"{location}-management@deytech.se" in groups:
+            result.add(f"{location}-management@deytech.se")
+    result |= linear_groups_with_tokens(groups, ("all", "company"))
+    result |= linear_groups_with_tokens(groups, ("announcements",))
+    return sorted(result)
+
+class GroupIndexTest(unittest.TestCase):
+    def test_lookups_match_linear_scans(self):
+        rng = random.Random(1)
+        for _ in range(30):
+            groups = generate_directory(rng, rng.randint(10, 400))
+            index = gws.GroupIndex(groups)
+            self.assertEqual(len(index), len(groups))
+            self.assertEqual(sorted(index), sorted(groups))
+            for group in rng.sample(groups, 10):
+                self.assertIn(group, index)
+                self.assertNotIn("x" + group, index)
+                prefix = group[:rng.randint(1, len(group))]
+                self.assertEqual(sorted(index.groups_with_prefix(prefix)), sorted(g for g in groups if g.startswith(prefix)))
+                tokens = tuple(local_tokens(group)[:rng.randint(1, 2)])
+                self.assertEqual(index.groups_with_tokens(tokens), linear_groups_with_tokens(groups, tokens))
+                self.assertEqual(index.groups_with_tokens(tokens, re.compile("manager")), linear_groups_with_tokens(groups, tokens, "manager"))
+
+    def test_with_changes_matches_a_new_index(self):
+        rng = random.Random(2)
+        for _ in range(20):
+            groups = generate_directory(rng, 200)
+            removed = rng.sample(groups, 30)
+            # merge_group_changes() never reports a group as both added and removed
+            added = [group for group in generate_directory(rng, 230) if group not in removed][:40]
+            changed = gws.GroupIndex(groups).with_changes(added, removed)
+            expected = sorted(set(groups) - set(removed) | set(added))
+            rebuilt = gws.GroupIndex(expected, changed.domain)
+            self.assertEqual(sorted(changed), expected)
+            for token in {token for group in expected for token in local_tokens(group) if token}:
+                self.assertEqual(changed.groups_with_tokens((token,)), rebuilt.groups_with_tokens((token,)))
+
+    def test_resolution_matches_linear_rules(self):
+        rules = gws.GroupRules.load(RULES_FILE)
+        rng = random.Random(3)
+        for _ in range(30):
+            groups = generate_directory(rng, rng.randint(20, 400))
+            index = gws.GroupIndex(groups)
+            for _ in range(20):
+                department = rng.choice(gws.DEPARTMENTS)
+                location = rng.choice(LOCATIONS + [""]).title()
+                job_title = rng.choice(JOB_TITLES)
+                key = gws.resolution_key(department, location, job_title, rules, index)
+                self.assertEqual(gws.resolve_groups(key, index, rules), linear_determine_groups(department, location, job_title, groups),
+                                 (department, location, job_title))
+
+    def test_tokens_do_not_match_inside_words(self):
+        index = gws.GroupIndex(["hr@deytech.se", "hr-benefits@deytech.se", "chrome@deytech.se", "hrm-tools@deytech.se"])
+        self.assertEqual(index.groups_with_tokens(("hr",)), {"hr@deytech.se", "hr-benefits@deytech.se"})
+
+    def test_tokens_of_a_single_group(self):
+        index = gws.GroupIndex(["project-x-001@deytech.se", "project-y-002@deytech.se", "team-alpha@deytech.se", "TEAM-Beta@partner.com", "alphabet@deytech.se"])
+        self.assertEqual(index.groups_with_tokens(("alpha",)), {"team-alpha@deytech.se"})
+        self.assertEqual(index.groups_with_tokens(("beta",)), {"TEAM-Beta@partner.com"})
+        self.assertEqual(index.groups_with_tokens(("project", "x")), {"project-x-001@deytech.se"})
+        self.assertEqual(index.groups_with_tokens(("partner",)), set())
+
+        # "alpha" becomes shared by two groups, then belongs to one group again
+        shared = index.with_changes(["alpha-team@deytech.se"], [])
+        self.assertEqual(shared.groups_with_tokens(("alpha",)), {"team-alpha@deytech.se", "alpha-team@deytech.se"})
+        single = shared.with_changes(["alpha-squad@deytech.se"], ["team-alpha@deytech.se", "alpha-team@deytech.se"])
+        self.assertEqual(single.groups_with_tokens(("alpha",)), {"alpha-squad@deytech.se"})
+        self.assertEqual(index.groups_with_tokens(("alpha",)), {"team-alpha@deytech.se"})
+
+if __name__ == "__main__":
+    unittest.main()
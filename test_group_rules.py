@@ -0,0 +1,108 @@
+"""Lenient matching of typed locations and departments in GroupRules."""
+import os
+import unittest
+
+import gws_user_creator as gws
+
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "group_rules.json")
+
+# A small tenant in the deytech.se naming scheme, with department, team and project groups whose
+# first words look like locations to a plain first-word match
+GROUPS = [
+    "all-company@deytech.se", "announcements@deytech.se",
+    "hr@deytech.se", "hr-benefits@deytech.se", "hr-managers@deytech.se",
+    "sales@deytech.se", "sales-operations@deytech.se", "sales-managers@deytech.se", "sales-directors@deytech.se", "sales-leadership@deytech.se",
+    "team-alpha@deytech.se", "team-beta@deytech.se", "team-sales-social@deytech.se",
+    "project-x@deytech.se", "project-apollo@deytech.se",
+    "stockholm-office@deytech.se", "stockholm-all@deytech.se", "stockholm-management@deytech.se",
+    "gothenburg-office@deytech.se", "gothenburg-facilities@deytech.se", "gothenburg-management@deytech.se",
+    "malmo-office@deytech.se", "remote-team@deytech.se",
+    "uppsala-it@deytech.se", "uppsala-social@deytech.se", "uppsala-management@deytech.se",
+]
+
+class LocationNameTest(unittest.TestCase):
+    def setUp(self):
+        self.rules = gws.GroupRules.load(RULES_FILE)
+        self.index = gws.GroupIndex(GROUPS)
+
+    def test_known_locations_are_matched_leniently(self):
+        for typed, expected in [("Stockholm", "stockholm"), (" stockholm ", "stockholm"), ("Stokholm", "stockholm"),
+                                ("Gothenburg office", "gothenburg"), ("Göteborg", "gothenburg"), ("gbg", "gothenburg"),
+                                ("Malmö", "malmo"), ("wfh", "remote"), ("", "")]:
+            self.assertEqual(self.rules.location_name(typed, self.index), expected, typed)
+
+    def test_departments_and_near_misses_are_not_locations(self):
+        for typed in ["Sales office", "Salem", "Teams", "HR", "Atlantis"]:
+            self.assertEqual(self.rules.location_name(typed, self.index), "", typed)
+
+    def test_exact_first_words_of_groups_are_locations(self):
+        for typed, expected in [("Uppsala", "uppsala"), ("uppsala office", "uppsala"), ("Team", "team")]:
+            self.assertEqual(self.rules.location_name(typed, self.index), expected, typed)
+        key = gws.resolution_key("HR", "Uppsala", "HR Manager", self.rules, self.index)
+        groups = gws.resolve_groups(key, self.index, self.rules)
+        for group in ["uppsala-it@deytech.se", "uppsala-social@deytech.se", "uppsala-management@deytech.se"]:
+            self.assertIn(group, groups)
+
+    def test_unknown_location_adds_no_groups_and_is_logged(self):
+        without_location = gws.resolve_groups(gws.resolution_key("HR", "", "Recruiter", self.rules, self.index), self.index, self.rules)
+        for typed in ["Sales office", "Salem", "Teams"]:
+            with self.assertLogs("gws_user_creator", "WARNING") as logs:
+                key = gws.resolution_key("HR", typed, "Recruiter", self.rules, self.index, warn=True)
+            self.assertIn(typed, logs.output[0])
+            self.assertEqual(gws.resolve_groups(key, self.index, self.rules), without_location, typed)
+
+    def test_locations_listed_in_the_rules_file(self):
+        rules = gws.GroupRules({"locations": {"names": ["Lund"], "group_suffixes": ["site"]}, "rules": []})
+        index = gws.GroupIndex(["kiruna-site@deytech.se", "stockholm-office@deytech.se"])
+        self.assertEqual(rules.location_name("Lund", index), "lund")
+        self.assertEqual(rules.location_name("Kiruna", index), "kiruna")
+        self.assertEqual(rules.location_name("Kirunaa", index), "kiruna")
+        self.assertEqual(rules.location_name("Stockholmm", index), "")
+
+    def test_location_groups_for_a_known_location(self):
+        key = gws.resolution_key("HR", "Stockholm office", "HR Manager", self.rules, self.index)
+        groups = gws.resolve_groups(key, self.index, self.rules)
+        self.assertIn("stockholm-office@deytech.se", groups)
+        self.assertIn("stockholm-management@deytech.se", groups)
+        self.assertNotIn("sales-managers@deytech.se", groups)
+
+    def test_suggestions_only_list_locations(self):
+        self.assertEqual(self.rules.location_suggestions("st", self.index), ["stockholm"])
+        self.assertEqual(self.rules.location_suggestions("te", self.index), [])
+        self.assertIn("gothenburg", self.rules.location_suggestions("gö", self.index))
+
+class DepartmentKeyTest(unittest.TestCase):
+    def test_department_names_aliases_and_typos(self):
+        rules = gws.GroupRules.load(RULES_FILE)
+        for typed, expected in [("Engineering Support", "engineering"), ("Human Resources", "hr"), ("Enginering Support", "engineering"),
+                                ("core-business", "core-business"), ("", "")]:
+            self.assertEqual(rules.department_key(typed), expected, typed)
+
+class RuleConditionTest(unittest.TestCase):
+    def test_rule_values_are_folded_like_keys(self):
+        rules = gws.GroupRules({
+            "aliases": {"locations": {"göteborg": "gothenburg"}, "departments": {"human resources": "hr"}},
+            "roles": {"manager": ""},
+            "rules": [
+                {"name": "Malmö office", "when": {"location": "Malmö"}, "groups": "malmo-office"},
+                {"name": "Göteborg office", "when": {"location": " Göteborg "}, "groups": "gothenburg-office"},
+                {"name": "HR", "when": {"department": "Human Resources"}, "groups": "hr"},
+                {"name": "Core business", "when": {"department": ["Core Business"]}, "groups": "core-business-social"},
+                {"name": "Managers", "when": {"role": "Manager"}, "groups": "all-managers"},
+            ],
+        })
+        index = gws.GroupIndex(["malmo-office@deytech.se", "gothenburg-office@deytech.se", "hr@deytech.se",
+                                "core-business-social@deytech.se", "all-managers@deytech.se"])
+        for department, location, job_title, expected in [
+            ("", "Malmö", "", ["malmo-office@deytech.se"]),
+            ("", "malmo", "", ["malmo-office@deytech.se"]),
+            ("", "Gothenburg", "", ["gothenburg-office@deytech.se"]),
+            ("HR", "", "", ["hr@deytech.se"]),
+            ("Core Business", "", "", ["core-business-social@deytech.se"]),
+            ("", "", "Sales Manager", ["all-managers@deytech.se"]),
+        ]:
+            key = gws.resolution_key(department, location, job_title, rules, index)
+            self.assertEqual(gws.resolve_groups(key, index, rules), expected, (department, location, job_title))
+
+if __name__ == "__main__":
+    unittest.main()
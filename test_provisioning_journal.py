@@ -0,0 +1,38 @@
+"""ProvisioningJournal decisions about `create user` results when a run is repeated."""
+import os
+import tempfile
+import unittest
+
+import gws_user_creator as gws
+
+CREATE = ["create", "user", "ann@deytech.se", "firstname", "Ann", "lastname", "Lee", "password", "secret"]
+EXISTS = "ERROR: User: ann@deytech.se, Create Failed: Duplicate, Entity already exists."
+
+class InterruptedCreateTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "journal.sqlite3")
+        self.journal = gws.ProvisioningJournal(self.path)
+        self.addCleanup(self.journal.close)
+
+    def test_create_planned_by_an_earlier_run_counts_as_done(self):
+        # The earlier run planned the create and stopped before recording its result
+        self.journal.plan("ann@deytech.se", [CREATE])
+        rerun = gws.ProvisioningJournal(self.path)
+        self.addCleanup(rerun.close)
+        rerun.plan("ann@deytech.se", [CREATE])
+        result = rerun.record("ann@deytech.se", gws.GamResult(CREATE, 1, "", EXISTS))
+        self.assertTrue(result.ok)
+        self.assertEqual(gws.provisioning_status([result]), "created")
+        self.assertTrue(rerun.is_done("ann@deytech.se", CREATE))
+
+    def test_existing_account_on_a_first_create_fails(self):
+        self.journal.plan("ann@deytech.se", [CREATE])
+        result = self.journal.record("ann@deytech.se", gws.GamResult(CREATE, 1, "", EXISTS))
+        self.assertFalse(result.ok)
+        self.assertEqual(gws.provisioning_status([result]), "failed")
+        self.assertFalse(self.journal.is_done("ann@deytech.se", CREATE))
+
+if __name__ == "__main__":
+    unittest.main()